@@ -0,0 +1,186 @@
+import asyncio
+import contextlib
+import hashlib
+import math
+import os
+import time
+from collections import deque
+
+# Requests per second each user may sustain, and the burst allowed on top
+RATE_PER_S = float(os.environ.get("HEART_RATE_LIMIT", "0.5"))
+BURST = int(os.environ.get("HEART_RATE_BURST", "10"))
+# Concurrent extractions per process; further requests wait in per-user queues
+ANALYSIS_SLOTS = int(os.environ.get("HEART_ANALYSIS_SLOTS", str(os.cpu_count() or 1)))
+# Requests one user may have waiting before new ones are turned away
+MAX_QUEUED_PER_USER = 8
+# Idle buckets are dropped beyond this many users
+MAX_TRACKED_USERS = 10000
+
+def parse_weights(spec):
+    """"uid:2,other:0.5" -> {"uid": 2.0, "other": 0.5} (users not listed weigh 1)"""
+    weights = {}
+    for item in filter(None, spec.split(",")):
+        uid, weight = item.rsplit(":", 1)
+        weights[uid.strip()] = float(weight)
+    return weights
+
+TENANT_WEIGHTS = parse_weights(os.environ.get("HEART_TENANT_WEIGHTS", ""))
+
+class AdmissionRejected(Exception):
+    """Request refused by admission control; retry_after is in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+def tenant_key(uid):
+    """Stable pseudonym for metrics, so user IDs are not exposed"""
+    return hashlib.sha256(uid.encode()).hexdigest()[:12]
+
+class RateLimiter:
+    """Token bucket per user: rate tokens per second up to burst"""
+
+    def __init__(self, rate=RATE_PER_S, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    def take(self, uid, cost=1):
+        """Spend cost tokens or raise AdmissionRejected with the wait until they refill"""
+        now = time.monotonic()
+        tokens, last = self.buckets.get(uid, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens < cost:
+            self.buckets[uid] = (tokens, now)
+            raise AdmissionRejected("Rate limit exceeded", (cost - tokens) / self.rate)
+        self.buckets[uid] = (tokens - cost, now)
+        if len(self.buckets) > MAX_TRACKED_USERS:
+            self._prune(now)
+
+    def _prune(self, now):
+        # A bucket that has refilled is the same as no bucket
+        full = [uid for uid, (tokens, last) in self.buckets.items()
+                if tokens + (now - last) * self.rate >= self.burst]
+        for uid in full:
+            del self.buckets[uid]
+
+class FairScheduler:
+    """Weighted fair queuing of extraction slots between users
+
+    Start-time fair queuing: each request gets a virtual start tag
+    max(virtual time, the user's previous finish tag) and a finish tag
+    start + 1 / weight. A freed slot goes to the waiting request with the
+    smallest start tag, so a user with a deep backlog only gets their
+    weighted share and a user with one request is served next. Runs on the
+    event loop, so no locking is needed.
+    """
+
+    def __init__(self, slots=ANALYSIS_SLOTS, weights=TENANT_WEIGHTS, max_queued=MAX_QUEUED_PER_USER):
+        self.slots = slots
+        self.free = slots
+        self.weights = weights
+        self.max_queued = max_queued
+        self.virtual_time = 0.0
+        self.finish = {}
+        self.queues = {}
+        self.running = {}
+        self.stats = {}
+        self.service_s = 1.0      # Running mean of slot hold time, for Retry-After
+
+    def _tag(self, uid):
+        start = max(self.virtual_time, self.finish.get(uid, 0.0))
+        self.finish[uid] = start + 1.0 / self.weights.get(uid, 1.0)
+        return start
+
+    def _count(self, uid, key):
+        stats = self.stats.setdefault(uid, {"admitted": 0, "rate_limited": 0, "rejected": 0})
+        stats[key] += 1
+
+    def _grant(self, uid):
+        self.running[uid] = self.running.get(uid, 0) + 1
+        self._count(uid, "admitted")
+
+    def _release(self, uid):
+        self.running[uid] -= 1
+        if not self.running[uid]:
+            del self.running[uid]
+        while True:
+            waiting = [(queue[0][0], owner) for owner, queue in self.queues.items() if queue]
+            if not waiting:
+                self.free += 1
+                return
+            # The slot passes straight to the next request in virtual-time order
+            start, owner = min(waiting)
+            _, future = self.queues[owner].popleft()
+            if not self.queues[owner]:
+                del self.queues[owner]
+            # A waiter cancelled this tick has not dequeued itself yet; skip it
+            if future.done():
+                continue
+            self.virtual_time = start
+            self._grant(owner)
+            future.set_result(None)
+            return
+
+    def waiting(self):
+        """Requests queued for a slot, across all users"""
+        return sum(len(queue) for queue in self.queues.values())
+
+    def reject_rate_limited(self, uid):
+        self._count(uid, "rate_limited")
+
+    @contextlib.asynccontextmanager
+    async def slot(self, uid):
+        """Hold one extraction slot for the duration of the block"""
+        queue = self.queues.get(uid)
+        if queue is not None and len(queue) >= self.max_queued:
+            self._count(uid, "rejected")
+            raise AdmissionRejected("Too many requests queued", len(queue) * self.service_s / self.slots)
+
+        start = self._tag(uid)
+        if self.free > 0 and not self.queues:
+            self.free -= 1
+            self._grant(uid)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.queues.setdefault(uid, deque()).append((start, future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just as the client went away: pass the slot on
+                    self._release(uid)
+                else:
+                    # _release may already have dropped the cancelled entry
+                    queue = self.queues.get(uid)
+                    if queue is not None and (start, future) in queue:
+                        queue.remove((start, future))
+                        if not queue:
+                            del self.queues[uid]
+                raise
+
+        began = time.monotonic()
+        try:
+            yield
+        finally:
+            self.service_s += 0.1 * (time.monotonic() - began - self.service_s)
+            self._release(uid)
+
+    def metrics(self):
+        """Per-tenant queue depth, running extractions and admission counts"""
+        tenants = set(self.queues) | set(self.running) | set(self.stats)
+        return {
+            "slots": self.slots,
+            "free_slots": self.free,
+            "queued": self.waiting(),
+            "mean_service_s": round(self.service_s, 3),
+            "tenants": {
+                tenant_key(uid): {
+                    "queued": len(self.queues.get(uid, ())),
+                    "running": self.running.get(uid, 0),
+                    "weight": self.weights.get(uid, 1.0),
+                    **self.stats.get(uid, {"admitted": 0, "rate_limited": 0, "rejected": 0})
+                }
+                for uid in sorted(tenants)
+            }
+        }
@@ -0,0 +1,81 @@
+import os
+
+# "firebase" for production, "local" for offline runs and load tests
+HEART_BACKEND = os.environ.get("HEART_BACKEND", "firebase")
+
+FIREBASE_CREDENTIALS = "service-account.json"
+FIREBASE_BUCKET = "respirhythm.firebasestorage.app"
+
+# Local backend: bearer tokens "test-token-<uid>" authenticate as <uid>, and
+# storage paths resolve under a directory of recordings
+LOCAL_BUCKET_DIR = os.environ.get("HEART_LOCAL_BUCKET", "test_recordings")
+LOCAL_TOKEN_PREFIX = "test-token-"
+
+class AuthError(Exception):
+    """The bearer token is missing, expired or invalid"""
+
+class RecordingNotFound(Exception):
+    """No recording at the requested storage path"""
+
+class FirebaseBackend:
+    """Firebase Auth token verification and Cloud Storage downloads"""
+
+    def __init__(self, credentials_path=FIREBASE_CREDENTIALS, bucket=FIREBASE_BUCKET):
+        import firebase_admin
+        from firebase_admin import credentials, storage, auth
+        from google.cloud.exceptions import NotFound
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(credentials_path), {'storageBucket': bucket})
+        self._auth = auth
+        self._storage = storage
+        self._not_found = NotFound
+
+    def verify_token(self, token):
+        """uid of a Firebase ID token"""
+        try:
+            return self._auth.verify_id_token(token)['uid']
+        except (ValueError, self._auth.InvalidIdTokenError, self._auth.ExpiredIdTokenError,
+                self._auth.RevokedIdTokenError) as e:
+            raise AuthError(str(e))
+
+    def download(self, path):
+        """Object bytes from the storage bucket"""
+        try:
+            return self._storage.bucket().blob(path).download_as_bytes()
+        except self._not_found:
+            raise RecordingNotFound(path)
+
+class LocalBackend:
+    """Offline stand-in: fake tokens and a directory served as the bucket
+
+    "users/<uid>/patients/.../1741131711872.wav" resolves to
+    <root>/patients/.../1741131711872.wav if it exists, otherwise to
+    <root>/1741131711872.wav, so app-style paths work against a flat
+    folder such as test_recordings.
+    """
+
+    def __init__(self, root=LOCAL_BUCKET_DIR):
+        self.root = os.path.abspath(root)
+
+    def verify_token(self, token):
+        if not token or not token.startswith(LOCAL_TOKEN_PREFIX) or len(token) == len(LOCAL_TOKEN_PREFIX):
+            raise AuthError(f"Local backend expects tokens of the form {LOCAL_TOKEN_PREFIX}<uid>")
+        return token[len(LOCAL_TOKEN_PREFIX):]
+
+    def download(self, path):
+        parts = path.split("/")
+        relative = "/".join(parts[2:]) if parts[0] == "users" and len(parts) > 2 else path
+        for candidate in (relative, os.path.basename(path)):
+            full_path = os.path.abspath(os.path.join(self.root, candidate))
+            # Never serve files outside the bucket directory
+            if full_path.startswith(self.root + os.sep) and os.path.isfile(full_path):
+                with open(full_path, "rb") as f:
+                    return f.read()
+        raise RecordingNotFound(path)
+
+BACKENDS = {"firebase": FirebaseBackend, "local": LocalBackend}
+
+def get_backend(name=HEART_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'. Use one of {list(BACKENDS)}")
+    return BACKENDS[name]()
@@ -0,0 +1,61 @@
+import argparse
+import glob
+import io
+import os
+import time
+import pandas as pd
+import soundfile as sf
+from extract_features import load_audio, load_model_metadata, ANALYSIS_SR
+
+def encode(y, sr, fmt):
+    """Encode samples as 16-bit PCM WAV or FLAC bytes, like an app upload"""
+    buffer = io.BytesIO()
+    sf.write(buffer, y, sr, format=fmt, subtype="PCM_16")
+    return buffer.getvalue()
+
+def time_decode(data, sr, repeats):
+    """Best-of-repeats time to decode bytes into the analysis-rate array"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        load_audio(io.BytesIO(data), sr)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def benchmark(files, mbps, sr, repeats=3):
+    """Compare WAV and FLAC size, modelled transfer time at mbps and decode time"""
+    rows = []
+    for file_path in files:
+        y, native_sr = sf.read(file_path, dtype="float32")
+        row = {"File": os.path.basename(file_path), "Duration_s": len(y) / native_sr}
+        for fmt in ("WAV", "FLAC"):
+            data = encode(y, native_sr, fmt)
+            transfer = len(data) * 8 / (mbps * 1e6)
+            decode = time_decode(data, sr, repeats)
+            row.update({
+                f"{fmt}_KB": len(data) / 1024,
+                f"{fmt}_Transfer_ms": transfer * 1000,
+                f"{fmt}_Decode_ms": decode * 1000,
+                f"{fmt}_Total_ms": (transfer + decode) * 1000
+            })
+        row["SizeRatio"] = row["FLAC_KB"] / row["WAV_KB"]
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transfer plus decode time of WAV vs FLAC uploads")
+    parser.add_argument("recordings", nargs="?", default="test_recordings", help="Directory of WAV recordings")
+    parser.add_argument("--mbps", type=float, default=20.0, help="Modelled download bandwidth (Mbit/s)")
+    parser.add_argument("--repeats", type=int, default=3, help="Decode timing repeats (best is kept)")
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.recordings, "*.wav")))
+    sr = load_model_metadata()["analysis_sr"] or ANALYSIS_SR
+    report = benchmark(files, args.mbps, sr, args.repeats)
+
+    pd.set_option("display.width", 200)
+    print(f"\n=== WAV vs FLAC at {args.mbps:g} Mbit/s ===")
+    print(report.to_string(index=False, float_format=lambda v: f"{v:.3g}"))
+    print(f"\nTotal bytes: FLAC is {report['FLAC_KB'].sum() / report['WAV_KB'].sum():.0%} of WAV")
+    print(f"Mean transfer + decode: WAV {report['WAV_Total_ms'].mean():.1f} ms, "
+          f"FLAC {report['FLAC_Total_ms'].mean():.1f} ms")
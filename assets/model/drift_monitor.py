@@ -0,0 +1,133 @@
+import os
+import threading
+import joblib
+import numpy as np
+
+# Written next to the model by train_model_heart.py
+REFERENCE_PATH = "feature_reference.joblib"
+
+# Reference decile edges per feature; served values are histogrammed on them
+N_BINS = 10
+# Sketches forget at this rate (in requests) so a device change shows up
+# within a few hundred requests instead of being diluted by all history
+HALF_LIFE_REQUESTS = 500
+# Population stability index thresholds (common rule of thumb)
+PSI_MODERATE = 0.1
+PSI_DRIFT = 0.25
+# Scores are not reported until a feature has this many observations
+MIN_OBSERVATIONS = 30
+_EPS = 1e-4
+
+def bin_index(edges, values):
+    """Histogram bin of each value per feature; edges is (features, n_edges)
+    padded with +inf, values is (..., features). NaN maps to -1."""
+    index = (values[..., None] >= edges).sum(axis=-1)
+    return np.where(np.isnan(values), -1, index)
+
+def build_reference(X, n_bins=N_BINS):
+    """Reference distribution of each training feature: quantile edges,
+    bin fractions and moments (X is the training feature DataFrame)"""
+    values = X.to_numpy(dtype=float)
+    edges = np.full((values.shape[1], n_bins - 1), np.inf)
+    for j in range(values.shape[1]):
+        column = values[~np.isnan(values[:, j]), j]
+        quantiles = np.unique(np.quantile(column, np.linspace(0, 1, n_bins + 1)[1:-1]))
+        edges[j, :len(quantiles)] = quantiles
+    index = bin_index(edges, values)
+    fractions = np.stack([(index == b).sum(axis=0) for b in range(n_bins)], axis=1).astype(float)
+    fractions /= np.maximum(fractions.sum(axis=1, keepdims=True), 1)
+    return {
+        "features": list(X.columns),
+        "edges": edges,
+        "fractions": fractions,
+        "mean": np.nanmean(values, axis=0),
+        "std": np.nanstd(values, axis=0),
+        "n": len(values)
+    }
+
+def population_stability_index(expected, observed):
+    """PSI between reference and observed bin fractions, per feature (rows)"""
+    expected = np.maximum(expected, _EPS)
+    observed = np.maximum(observed, _EPS)
+    return ((observed - expected) * np.log(observed / expected)).sum(axis=1)
+
+class FeatureDriftMonitor:
+    """Constant-memory sketches of served feature values, scored against the
+    training reference
+
+    Per feature it keeps an exponentially weighted mean and variance and a
+    histogram over the reference decile edges (a fixed-size quantile
+    sketch). One update is a few vector operations over all features.
+    State is per process; with several uvicorn or job workers each one
+    reports its own traffic.
+    """
+
+    def __init__(self, reference, half_life=HALF_LIFE_REQUESTS):
+        self.reference = reference
+        self.features = reference["features"]
+        self._column = {name: j for j, name in enumerate(self.features)}
+        self.min_alpha = 1 - 0.5 ** (1 / half_life)
+        n_features, n_bins = reference["fractions"].shape
+        self.count = np.zeros(n_features)
+        self.mean = np.zeros(n_features)
+        self.var = np.zeros(n_features)
+        self.hist = np.zeros((n_features, n_bins))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=REFERENCE_PATH):
+        """Monitor for the reference saved with the model, or None without one"""
+        if not os.path.exists(path):
+            return None
+        return cls(joblib.load(path))
+
+    def update(self, features):
+        """Add one request's feature dict (missing features are skipped)"""
+        values = np.full(len(self.features), np.nan)
+        for name, value in features.items():
+            j = self._column.get(name)
+            if j is not None:
+                values[j] = value
+        seen = ~np.isnan(values)
+        onehot = bin_index(self.reference["edges"], values)[:, None] == np.arange(self.hist.shape[1])
+
+        with self._lock:
+            self.count += seen
+            # Plain averages until the window fills, then exponential forgetting
+            alpha = np.where(seen, np.maximum(1 / np.maximum(self.count, 1), self.min_alpha), 0.0)
+            delta = np.where(seen, values, 0.0) - self.mean
+            self.mean += alpha * delta
+            self.var = (1 - alpha) * (self.var + alpha * delta ** 2)
+            self.hist += alpha[:, None] * (onehot - self.hist)
+
+    def report(self):
+        """Drift scores per feature and overall"""
+        with self._lock:
+            count, mean, var, hist = self.count.copy(), self.mean.copy(), self.var.copy(), self.hist.copy()
+        ref = self.reference
+        psi = population_stability_index(ref["fractions"], hist)
+        # Shift of the served mean in reference standard deviations
+        mean_shift = (mean - ref["mean"]) / np.maximum(ref["std"], 1e-12)
+        std_ratio = np.sqrt(var) / np.maximum(ref["std"], 1e-12)
+        ready = count >= MIN_OBSERVATIONS
+
+        features = {}
+        for j, name in enumerate(self.features):
+            if not ready[j]:
+                features[name] = {"observations": int(count[j]), "status": "insufficient_data"}
+                continue
+            features[name] = {
+                "observations": int(count[j]),
+                "psi": round(float(psi[j]), 4),
+                "mean_shift_std": round(float(mean_shift[j]), 3),
+                "std_ratio": round(float(std_ratio[j]), 3),
+                "status": "drift" if psi[j] >= PSI_DRIFT else "moderate" if psi[j] >= PSI_MODERATE else "stable"
+            }
+        scored = psi[ready]
+        return {
+            "pid": os.getpid(),
+            "reference_size": int(ref["n"]),
+            "max_psi": round(float(scored.max()), 4) if scored.size else None,
+            "drifted": [name for name, f in features.items() if f["status"] == "drift"],
+            "features": features
+        }
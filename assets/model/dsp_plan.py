@@ -0,0 +1,132 @@
+import functools
+import os
+import numpy as np
+import librosa
+import scipy.fft
+from scipy.signal import butter, get_window
+
+# Analysis settings shared by preprocess_heart_sound and extract_features
+N_FFT = 2048
+HOP_LENGTH = 256        # Onset envelope, peak timing and MFCC hop
+SPECTRAL_HOP = 512      # librosa's default hop, used by band energy, contrast and flatness
+N_MELS = 26             # Custom Mel banks (closer to study's "25–42")
+N_MFCC = 13
+ONSET_N_MELS = 128
+ONSET_FMAX = 500        # Focus on heart sound frequency range
+BANDPASS_HZ = (20, 400)
+BANDPASS_ORDER = 4
+
+# Floating-point precision of the extraction pipeline. float32 halves memory
+# traffic in the hot path; see precision_report.py for the equivalence check
+# against float64.
+DSP_PRECISION = os.environ.get("HEART_DSP_PRECISION", "float32")
+
+# Only a handful of distinct rates occur in practice (mostly the canonical rate)
+PLAN_CACHE_SIZE = 8
+
+def butter_bandpass(lowcut, highcut, fs, order=5):
+    nyq = 0.5 * fs
+    low = lowcut / nyq
+    high = highcut / nyq
+    b, a = butter(order, [low, high], btype='band')
+    return b, a
+
+class DSPPlan:
+    """Filter coefficients, window, frequency grid, mel and DCT bases for one
+    (sample rate, n_fft, hop, precision) combination. Build it through get_dsp_plan()."""
+
+    def __init__(self, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, dtype=DSP_PRECISION):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.dtype = np.dtype(dtype)
+
+        # IIR coefficients stay in double precision; the filter output is cast back
+        self.bandpass = butter_bandpass(*BANDPASS_HZ, sr, order=BANDPASS_ORDER)
+
+        # 10 ms moving average, odd length for filtfilt
+        n_smooth = int(sr * 0.01)
+        if n_smooth % 2 == 0:
+            n_smooth += 1
+        self.smoothing_kernel = np.ones(n_smooth) / n_smooth
+
+        # Spectral constants in the working precision so products do not upcast
+        self.window = get_window('hann', n_fft, fftbins=True).astype(self.dtype)
+        self.fft_freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+        self.mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=N_MELS, dtype=self.dtype)
+        self.onset_mel_basis = librosa.filters.mel(
+            sr=sr, n_fft=n_fft, n_mels=ONSET_N_MELS, fmax=ONSET_FMAX, dtype=self.dtype
+        )
+        # Orthonormal DCT-II as a matrix, truncated to the kept coefficients
+        self.dct_matrix = scipy.fft.dct(np.eye(N_MELS), type=2, norm='ortho', axis=0)[:N_MFCC].astype(self.dtype)
+
+    def stft_magnitude(self, y, hop_length=None):
+        """|STFT| with the cached window (same framing as librosa.stft defaults)"""
+        return np.abs(librosa.stft(
+            y, n_fft=self.n_fft, hop_length=hop_length or self.hop_length, window=self.window
+        ))
+
+    def segment_stft_magnitudes(self, y, bounds, hop_length=None):
+        """|STFT| of many segments of y in one batched FFT
+        
+        Each y[start:end] row of bounds is framed exactly as stft_magnitude
+        frames it alone (centered, zero padded). Returns the magnitudes of all
+        frames side by side and the index of each segment's first frame, for
+        np.add.reduceat-style per-segment reductions.
+        """
+        hop_length = hop_length or self.hop_length
+        pad = np.zeros(self.n_fft // 2, dtype=y.dtype)
+        pieces, starts, offsets = [], [], [0]
+        position = 0
+        for start, end in bounds:
+            pieces += [pad, y[start:end], pad]
+            n_frames = 1 + (end - start) // hop_length
+            starts.append(position + hop_length * np.arange(n_frames))
+            offsets.append(offsets[-1] + n_frames)
+            position += end - start + 2 * len(pad)
+        
+        frames = np.lib.stride_tricks.sliding_window_view(np.concatenate(pieces), self.n_fft)
+        frames = frames[np.concatenate(starts)] * self.window
+        return np.abs(scipy.fft.rfft(frames, axis=-1)).T, np.array(offsets[:-1])
+
+    def band_slice(self, low, high):
+        """Slice of STFT rows covering [low, high) Hz"""
+        return slice(np.searchsorted(self.fft_freqs, low), np.searchsorted(self.fft_freqs, high))
+
+    def mfcc(self, magnitude):
+        """MFCCs from an |STFT|, equivalent to librosa.feature.mfcc(n_mfcc=N_MFCC, n_mels=N_MELS)
+
+        The magnitude array is squared in place and should not be reused.
+        """
+        mel = self.mel_basis @ np.square(magnitude, out=magnitude)
+        return self.dct_matrix @ librosa.power_to_db(mel)
+
+    def segment_mfcc(self, magnitude, offsets):
+        """mfcc() of side-by-side segment spectrograms (see segment_stft_magnitudes)
+        
+        power_to_db's 80 dB floor is relative to each segment's own peak,
+        exactly as if every segment had been transformed alone.
+        """
+        mel = self.mel_basis @ np.square(magnitude, out=magnitude)
+        mel_db = librosa.power_to_db(mel, top_db=None)
+        segment_peak = np.maximum.reduceat(mel_db.max(axis=0), offsets)
+        counts = np.diff(np.append(offsets, mel_db.shape[1]))
+        mel_db = np.maximum(mel_db, np.repeat(segment_peak, counts) - 80.0)
+        return self.dct_matrix @ mel_db
+
+    def onset_strength(self, y, aggregate=np.mean):
+        """Onset strength equivalent to librosa.onset.onset_strength(fmax=ONSET_FMAX)"""
+        magnitude = self.stft_magnitude(y)
+        mel = self.onset_mel_basis @ np.square(magnitude, out=magnitude)
+        return librosa.onset.onset_strength(
+            S=librosa.power_to_db(mel), sr=self.sr, hop_length=self.hop_length,
+            n_fft=self.n_fft, aggregate=aggregate
+        )
+
+def get_dsp_plan(sr, n_fft=N_FFT, hop_length=HOP_LENGTH, dtype=DSP_PRECISION):
+    """Memoized DSPPlan; least recently used plans are evicted"""
+    return _cached_plan(sr, n_fft, hop_length, np.dtype(dtype).name)
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _cached_plan(sr, n_fft, hop_length, dtype):
+    return DSPPlan(sr, n_fft, hop_length, dtype)
@@ -0,0 +1,85 @@
+import numpy as np
+
+# Trees evaluated between stopping checks
+EARLY_EXIT_BATCH = 10
+# Probability that an early decision differs from the full forest's (per row,
+# across all checks)
+EARLY_EXIT_DELTA = 0.01
+THRESHOLD = 0.5
+
+def split_pipeline(model):
+    """(preprocessing steps, forest) of a fitted pipeline, or ([], model) for a bare forest"""
+    if hasattr(model, "steps"):
+        # Samplers such as SMOTE only act during fit
+        return [step for _, step in model.steps[:-1] if hasattr(step, "transform")], model.steps[-1][1]
+    return [], model
+
+class EarlyExitForest:
+    """Evaluate a random forest's trees in batches and stop once the vote is settled
+
+    The forest's probability is the mean of its trees' leaf probabilities.
+    After n of N trees, the partial mean is within eps of the full mean with
+    probability 1 - delta, by the Hoeffding-Serfling bound for sampling
+    without replacement:
+
+        eps = sqrt((1 - (n - 1) / N) * log(2 K / delta) / (2 n))
+
+    with delta split over the K checks. A row stops as soon as its partial
+    mean is further than eps from the threshold.
+
+    The bound assumes the evaluated trees are a fresh random draw for each
+    prediction. Here they are taken in the forest's fitted order, which is
+    the same for every row, so 1 - delta is a heuristic target rather than
+    a guarantee: the actual agreement with full evaluation is measured on
+    the holdout by validate_early_exit (model_metadata.json "early_exit").
+    """
+
+    def __init__(self, model, batch=EARLY_EXIT_BATCH, delta=EARLY_EXIT_DELTA, threshold=THRESHOLD):
+        self.preprocess, forest = split_pipeline(model)
+        self.trees = forest.estimators_
+        self.positive = list(forest.classes_).index(1)
+        self.threshold = threshold
+        n_trees = len(self.trees)
+        self.checkpoints = np.arange(batch, n_trees + batch, batch).clip(max=n_trees)
+        n = self.checkpoints
+        self.eps = np.sqrt((1 - (n - 1) / n_trees) * np.log(2 * len(n) / delta) / (2 * n))
+
+    def transform(self, X):
+        for step in self.preprocess:
+            X = step.transform(X)
+        return np.asarray(X, dtype=np.float32)
+
+    def predict_proba(self, X):
+        """Returns (positive-class probability, trees evaluated) per row
+
+        The probability is the partial mean over the evaluated trees (equal
+        to predict_proba for rows that needed every tree).
+        """
+        Xt = self.transform(X)
+        total = np.zeros(len(Xt))
+        n_used = np.zeros(len(Xt), dtype=int)
+        active = np.arange(len(Xt))
+        start = 0
+        for end, eps in zip(self.checkpoints, self.eps):
+            rows = Xt[active]
+            for tree in self.trees[start:end]:
+                total[active] += tree.predict_proba(rows, check_input=False)[:, self.positive]
+            n_used[active] = end
+            start = end
+            settled = np.abs(total[active] / end - self.threshold) > eps
+            active = active[~settled]
+            if active.size == 0:
+                break
+        return total / n_used, n_used
+
+def validate_early_exit(model, X, **kwargs):
+    """Compare early-exit decisions with full evaluation on X (e.g. the holdout)"""
+    early = EarlyExitForest(model, **kwargs)
+    proba, n_used = early.predict_proba(X)
+    full = model.predict_proba(X)[:, early.positive]
+    return {
+        "agreement": float(np.mean((proba > early.threshold) == (full > early.threshold))),
+        "mean_trees": float(np.mean(n_used)),
+        "total_trees": len(early.trees),
+        "max_abs_proba_error": float(np.max(np.abs(proba - full))) if len(full) else 0.0
+    }
@@ -0,0 +1,91 @@
+import numpy as np
+from scipy.signal import filtfilt
+from numpy.lib.stride_tricks import sliding_window_view
+from peak_detection import pick_peaks
+from dsp_plan import butter_bandpass
+
+# Default rate ECG samples are resampled to. The AD8232 front end on the
+# ESP32 (arduino/PulseOx/ECG_Pulse.ino) is read with analogRead inside the
+# display loop and streamed over BLE with millisecond timestamps, so the
+# raw stream is irregular; see resample_ecg.
+ECG_SR = 250
+
+# Pan-Tompkins style QRS detector settings
+QRS_BAND_HZ = (5, 15)
+INTEGRATION_WINDOW_S = 0.15
+REFRACTORY_S = 0.25          # No two R peaks closer than this (240 BPM)
+R_THRESHOLD = 0.3            # Fraction of the robust envelope maximum
+MIN_R_PEAKS = 3              # Two complete R-R intervals
+
+# Electromechanical timing relative to the R peak, used to gate the
+# phonocardiogram (S1 follows the QRS by 20-100 ms, S2 ends systole)
+S1_WINDOW_S = (0.0, 0.2)
+S2_MIN_DELAY_S = 0.2
+S2_MAX_RR_FRACTION = 0.6
+
+def resample_ecg(values, timestamps_ms, sr=ECG_SR):
+    """Linearly interpolate timestamped ECG samples onto a uniform sr grid"""
+    t = (np.asarray(timestamps_ms, dtype=float) - timestamps_ms[0]) / 1000.0
+    grid = np.arange(0, t[-1], 1.0 / sr)
+    return np.interp(grid, t, np.asarray(values, dtype=float))
+
+def detect_r_peaks(ecg, sr=ECG_SR):
+    """R-peak times (seconds) from a single-lead ECG
+
+    Band-pass to the QRS band, differentiate, square and integrate over a
+    moving window, then pick envelope peaks with a refractory period. Each
+    detection is moved back to the largest filtered sample in the preceding
+    integration window, where the R wave actually is.
+    """
+    ecg = np.asarray(ecg, dtype=float)
+    if len(ecg) < sr:
+        # Shorter than one beat, and than the filter's padding
+        return np.array([])
+    b, a = butter_bandpass(*QRS_BAND_HZ, sr, order=2)
+    filtered = filtfilt(b, a, ecg - np.median(ecg))
+
+    window = max(1, int(INTEGRATION_WINDOW_S * sr))
+    energy = np.square(np.gradient(filtered))
+    integrated = np.convolve(energy, np.ones(window) / window, mode='same')
+
+    refractory = max(1, int(REFRACTORY_S * sr))
+    threshold = R_THRESHOLD * np.percentile(integrated, 99)
+    candidates = pick_peaks(
+        integrated, pre_max=refractory, post_max=refractory,
+        pre_avg=refractory, post_avg=refractory, delta=threshold, wait=refractory
+    )
+    if len(candidates) == 0:
+        return np.array([])
+
+    # Refine every candidate at once over its preceding window
+    padded = np.concatenate((np.zeros(window), np.abs(filtered)))
+    lookback = sliding_window_view(padded, window + 1)[candidates]
+    r_samples = candidates - window + np.argmax(lookback, axis=1)
+    return np.unique(np.maximum(r_samples, 0)) / sr
+
+def _argmax_in_windows(x, starts, ends):
+    """Index of max(x[start:end]) for every window, in one masked pass"""
+    starts = np.clip(starts, 0, len(x) - 1)
+    ends = np.clip(ends, starts + 1, len(x))
+    offsets = np.arange(np.max(ends - starts))
+    idx = starts[:, None] + offsets
+    values = np.where(idx < ends[:, None], x[np.minimum(idx, len(x) - 1)], -np.inf)
+    return starts + np.argmax(values, axis=1)
+
+def ecg_gated_heart_sounds(envelope, sr, r_peak_times):
+    """S1 and S2 sample positions in the phonocardiogram envelope for each R-R interval
+
+    S1 is the envelope maximum shortly after the R peak and S2 the maximum
+    between S2_MIN_DELAY_S and S2_MAX_RR_FRACTION of the interval.
+    """
+    r_peak_times = np.asarray(r_peak_times)
+    r_peak_times = r_peak_times[r_peak_times * sr < len(envelope)]
+    if len(r_peak_times) < 2:
+        return np.array([], dtype=int), np.array([], dtype=int)
+
+    r = r_peak_times[:-1]
+    rr = np.diff(r_peak_times)
+    s1 = _argmax_in_windows(envelope, ((r + S1_WINDOW_S[0]) * sr).astype(int), ((r + S1_WINDOW_S[1]) * sr).astype(int))
+    s2 = _argmax_in_windows(envelope, ((r + S2_MIN_DELAY_S) * sr).astype(int),
+                            ((r + S2_MAX_RR_FRACTION * rr) * sr).astype(int))
+    return s1, s2
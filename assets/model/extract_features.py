@@ -3,20 +3,137 @@ import numpy as np
 import sys
 import json
 import os
-import matplotlib.pyplot as plt
 import pandas as pd
+import soundfile as sf
 # from librosa import effects
 from scipy import stats
-from scipy.signal import butter, filtfilt
+from scipy.signal import filtfilt, hilbert
+from scipy.fft import next_fast_len
 import pywt
+import logging
+from dsp_plan import get_dsp_plan, HOP_LENGTH, SPECTRAL_HOP, DSP_PRECISION
+from signal_quality import assess_signal_quality
+from peak_detection import pick_peaks, label_heart_sounds, S1
+from rhythm import rhythm_features
+from ecg import detect_r_peaks, ecg_gated_heart_sounds, ECG_SR, MIN_R_PEAKS
+from structured_logging import setup_logging
+from memory_profile import profiler
 # from antropy import sample_entropy
 
-def butter_bandpass(lowcut, highcut, fs, order=5):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    b, a = butter(order, [low, high], btype='band')
-    return b, a
+logger = logging.getLogger(__name__)
+
+# Bump whenever the extracted feature values or names change, so stored
+# feature matrices from earlier training runs are re-extracted.
+FEATURE_VERSION = 4
+
+# Canonical analysis rate. Every recording is resampled to this rate before
+# any DSP, so features do not depend on the capture device (the ESP32 MEMS
+# firmware records at 4 kHz, phone uploads are usually 44.1/48 kHz) and the
+# 20-400 Hz band of interest is not processed at 10x the needed rate.
+ANALYSIS_SR = 4000
+
+# Recordings longer than this are analyzed in overlapping windows with
+# bounded memory (see extract_features_chunked)
+LONG_RECORDING_S = 120.0
+CHUNK_WINDOW_S = 30.0
+CHUNK_OVERLAP_S = 5.0
+
+# Fixed window length for timeline mode when cycles cannot be segmented
+TIMELINE_WINDOW_S = 2.0
+
+# Detected peaks within this distance of an annotated S1/S2 count as matches
+MATCH_TOLERANCE_S = 0.1
+
+# Pipeline tiers: "fast" swaps HPSS + beat tracking for a Hilbert envelope
+# and computes a single spectrogram (see preprocess_signal, compute_features)
+PIPELINE_TIERS = ("full", "fast")
+# Peak threshold on the fast tier's log-compressed, max-normalized envelope
+FAST_PEAK_DELTA = 0.02
+
+# Written next to the model by train_model_heart.py
+MODEL_METADATA_PATH = "model_metadata.json"
+
+# Broader, physiologically relevant energy bands
+ENERGY_BANDS = [
+    (20, 100),   # S1 fundamental frequencies
+    (100, 200),  # S2 fundamental frequencies
+    (200, 400)   # Murmur frequencies
+]
+
+# Feature groups compute_features can skip, each with a test for the names
+# it produces. Spectral contrast and MFCC standard deviations are not listed:
+# select_optimal_features always dropped them, so they are no longer computed.
+FEATURE_GROUPS = {
+    "timing": lambda name: any(k in name for k in ("HeartRate", "Systole", "Diastole_", "Cycle_", "HRV_",
+                                                    "Alternation_")),
+    "mfcc": lambda name: "MFCC_mean_" in name,
+    "energy": lambda name: "Energy_" in name and "Wavelet_" not in name,
+    "wavelet": lambda name: "Wavelet_" in name,
+    "q_factor": lambda name: "Q_Factor" in name,
+    "flatness": lambda name: "SpectralFlatness" in name,
+    "zcr": lambda name: "ZeroCrossingRate" in name
+}
+# Groups that need the SPECTRAL_HOP spectrogram
+SPECTRAL_GROUPS = {"energy", "q_factor", "flatness"}
+
+# Formats the analysis path decodes (FLAC is lossless and a fraction of the WAV size)
+AUDIO_EXTENSIONS = ('.wav', '.flac')
+
+# Standard auscultation sites: Aortic, Mitral, Pulmonary, Tricuspid
+VALVE_PREFIXES = ["AV", "MV", "PV", "TV"]
+
+def load_audio(file_path, sr=ANALYSIS_SR):
+    """Load mono audio resampled to sr with a polyphase filter (sr=None keeps the native rate)
+    
+    file_path may also be a file-like object holding WAV or FLAC bytes
+    (e.g. io.BytesIO of a download), decoded in memory by soundfile.
+    """
+    rewind(file_path)
+    return librosa.load(file_path, sr=sr, res_type="polyphase")
+
+def rewind(source):
+    """Seek file-like audio sources back to the start before each decode"""
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+def audio_duration(file_path):
+    """Duration in seconds from the file header, or 0 if soundfile cannot read it"""
+    try:
+        rewind(file_path)
+        return sf.info(file_path).duration
+    except Exception:
+        return 0.0
+    finally:
+        rewind(file_path)
+
+def iter_audio_windows(file_path, sr=ANALYSIS_SR, window_s=CHUNK_WINDOW_S, overlap_s=CHUNK_OVERLAP_S):
+    """Yield (start_time, samples, sr) for overlapping windows, decoding one window at a time"""
+    rewind(file_path)
+    native_sr = sf.info(file_path).samplerate
+    rewind(file_path)
+    blocksize = int(window_s * native_sr)
+    overlap = int(overlap_s * native_sr)
+    blocks = sf.blocks(file_path, blocksize=blocksize, overlap=overlap, dtype='float32', always_2d=True)
+    for i, block in enumerate(blocks):
+        # The trailing block can lie entirely inside the previous overlap
+        if i > 0 and len(block) <= overlap:
+            break
+        y = block.mean(axis=1)  # Downmix to mono like librosa.load
+        if sr is not None and sr != native_sr:
+            y = librosa.resample(y, orig_sr=native_sr, target_sr=sr, res_type="polyphase")
+        yield i * (blocksize - overlap) / native_sr, y, sr or native_sr
+
+def load_model_metadata(path=MODEL_METADATA_PATH):
+    """Read the metadata saved with a model
+    
+    Models trained before the metadata file existed were trained at the
+    native sample rate, so analysis_sr falls back to None for them.
+    """
+    metadata = {"analysis_sr": None}
+    if os.path.exists(path):
+        with open(path) as f:
+            metadata.update(json.load(f))
+    return metadata
 
 def load_segmentation_data(tsv_file):
     """Load segmentation data from TSV file"""
@@ -26,45 +143,77 @@ def load_segmentation_data(tsv_file):
         segments.columns = ['start_time', 'end_time', 'segment_class']
         return segments
     except Exception as e:
-        print(f"Error loading segmentation data: {str(e)}")
+        logger.error("Error loading segmentation data: %s", e)
         return None
 
-def preprocess_heart_sound(file_path):
+def match_segments(peak_times, segments, tolerance=MATCH_TOLERANCE_S):
+    """For each annotated segment, whether a detected peak falls inside it (± tolerance)
+    
+    Binary search of the sorted peak times against every segment at once.
+    """
+    peak_times = np.sort(np.asarray(peak_times))
+    starts = segments['start_time'].to_numpy() - tolerance
+    ends = segments['end_time'].to_numpy() + tolerance
+    first = np.searchsorted(peak_times, starts, side='left')
+    return (first < len(peak_times)) & (peak_times[np.minimum(first, len(peak_times) - 1)] <= ends)
+
+def preprocess_heart_sound(file_path, sr=ANALYSIS_SR):
     """Preprocess heart sound recording with noise removal and segmentation"""
     try:
-        y, sr = librosa.load(file_path, sr=None)
+        y, sr = load_audio(file_path, sr)
+    except Exception as e:
+        logger.error("Preprocessing error: %s", e)
+        return None, None, None, None, None
+    return preprocess_signal(y, sr)
 
-        # Add pre-emphasis before filtering
-        y_preemph = librosa.effects.preemphasis(y, coef=0.97)  # coef from speech processing
-        
-        # Enhanced noise removal with bandpass filter (20-400 Hz)
-        # Heart sounds typically concentrated in 20-200 Hz range
-        b, a = butter_bandpass(20, 400, sr, order=4)  # Increased order for steeper roll-off
-        y_filtered = filtfilt(b, a, y_preemph)  # Zero-phase filtering
-        
-        # Amplitude normalization
-        y_normalized = librosa.util.normalize(y_filtered)
+def preprocess_signal(y, sr, precision=DSP_PRECISION, r_peak_times=None, tier="full"):
+    """Noise removal and segmentation of an already loaded recording
+    
+    The signal is cast to precision once; every later stage keeps that dtype.
+    With r_peak_times from a synchronized ECG, cycles are gated on the R
+    peaks and the acoustic S1 search (HPSS, onset strength, beat tracking)
+    is skipped. tier="fast" replaces that search with a Hilbert envelope
+    and fixed peak picking (see fast_segmentation).
+    """
+    try:
+        y = np.asarray(y, dtype=precision)
+        # Filter coefficients, windows and bases for this rate are built once
+        plan = get_dsp_plan(sr, dtype=y.dtype)
+
+        with profiler.stage("filter"):
+            # Add pre-emphasis before filtering
+            y_preemph = librosa.effects.preemphasis(y, coef=0.97)  # coef from speech processing
+            
+            # Enhanced noise removal with bandpass filter (20-400 Hz)
+            # Heart sounds typically concentrated in 20-200 Hz range
+            b, a = plan.bandpass  # Order 4 for steeper roll-off
+            # Zero-phase filtering (scipy works in float64, cast back to the working precision)
+            y_filtered = filtfilt(b, a, y_preemph).astype(y.dtype, copy=False)
+            
+            # Amplitude normalization (in place, same as librosa.util.normalize)
+            peak = np.max(np.abs(y_filtered))
+            if peak > np.finfo(y.dtype).tiny:
+                y_filtered /= peak
+            y_normalized = y_filtered
         
-        # Envelope detection for improved onset detection
-        # Get the amplitude envelope using Hilbert transform
-        analytic_signal = librosa.effects.harmonic(y_normalized, margin=8.0)
-        amplitude_envelope = np.abs(analytic_signal)
+        if r_peak_times is not None:
+            return ecg_gated_segmentation(y_normalized, sr, r_peak_times, plan)
+        if tier == "fast":
+            return fast_segmentation(y_normalized, sr, plan)
         
-        # Smooth the envelope
-        n_smooth = int(sr * 0.01)  # 10ms window
-        if n_smooth % 2 == 0:
-            n_smooth += 1  # Make sure it's odd for filtfilt
-        amplitude_envelope = filtfilt(np.ones(n_smooth)/n_smooth, 1, amplitude_envelope)
+        with profiler.stage("hpss"):
+            # Envelope detection for improved onset detection
+            # Get the amplitude envelope using Hilbert transform
+            analytic_signal = librosa.effects.harmonic(y_normalized, margin=8.0)
+            amplitude_envelope = np.abs(analytic_signal, out=analytic_signal)
         
-        # Compute onset strength using the envelope
-        hop_length = 256  # Reduced hop length for better time resolution
-        onset_env = librosa.onset.onset_strength(
-            y=amplitude_envelope, 
-            sr=sr, 
-            hop_length=hop_length,
-            aggregate=np.mean,  
-            fmax=500  # Focus on heart sound frequency range
-        )
+        with profiler.stage("onset"):
+            # Smooth the envelope (10ms moving average)
+            amplitude_envelope = filtfilt(plan.smoothing_kernel, 1, amplitude_envelope).astype(y.dtype, copy=False)
+            
+            # Compute onset strength using the envelope (mel band up to 500 Hz)
+            hop_length = HOP_LENGTH  # Reduced hop length for better time resolution
+            onset_env = plan.onset_strength(amplitude_envelope, aggregate=np.mean)
         
         # Define adaptive peak detection function
         def adaptive_peak_detection(onset_env, sr, hop_length):
@@ -76,7 +225,7 @@ def preprocess_heart_sound(file_path):
             # Adapt wait time based on estimated heart rate
             # Using librosa's beat tracking as a rough heart rate estimate
             tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
-            tempo = float(tempo)  # Convert to Python float
+            tempo = float(np.atleast_1d(tempo)[0])  # Convert to Python float
             # Ensure reasonable heart rate bounds (40-220 BPM)
             tempo = max(40, min(220, tempo)) if tempo > 0 else 80
             # Calculate minimum wait time (allowing for slightly faster detection than the estimated tempo)
@@ -91,7 +240,7 @@ def preprocess_heart_sound(file_path):
             post_avg_frames = max(1, int(0.1*window_scale*sr/hop_length))
             
             # Perform peak picking with adaptive parameters
-            peaks = librosa.util.peak_pick(
+            peaks = pick_peaks(
                 onset_env,
                 pre_max=pre_max_frames,
                 post_max=post_max_frames,
@@ -101,71 +250,133 @@ def preprocess_heart_sound(file_path):
                 wait=wait_frames
             )
             
-            # Log the adaptive parameters used
-            print(f"Adaptive peak detection: tempo={tempo:.1f} BPM, threshold={threshold:.4f}, wait={min_wait:.3f}s")
+            # Log the adaptive parameters used (DEBUG is sampled, see structured_logging)
+            logger.debug("Adaptive peak detection", extra={
+                "tempo_bpm": round(tempo, 1), "threshold": round(threshold, 4), "wait_s": round(min_wait, 3)
+            })
             
             return peaks
 
-        # Use adaptive peak detection
-        peaks = adaptive_peak_detection(onset_env, sr, hop_length)
+        with profiler.stage("peaks"):
+            # Use adaptive peak detection
+            peaks = adaptive_peak_detection(onset_env, sr, hop_length)
 
-        # If too few peaks detected, fall back to the original method
-        if len(peaks) < 4:  # Need at least 2 complete heart cycles
-            print("Adaptive peak detection found too few peaks. Falling back to fixed parameters.")
-            peaks = librosa.util.peak_pick(
-                onset_env,
-                pre_max=max(1, int(0.05*sr/hop_length)),
-                post_max=max(1, int(0.05*sr/hop_length)),
-                pre_avg=max(1, int(0.1*sr/hop_length)),
-                post_avg=max(1, int(0.1*sr/hop_length)),
-                delta=0.07,
-                wait=max(1, int(0.25*sr/hop_length))
-            )
-        
-        # Convert frame indices to sample indices
-        peak_times = librosa.frames_to_time(peaks, sr=sr, hop_length=hop_length)
-        peak_samples = (peak_times * sr).astype(int)
-        
-        # Segment into cardiac cycles with more reliable peak detection
-        segments = []
-        if len(peak_samples) >= 4:
-            # Try to identify S1-S2 pairs using amplitude and spacing
-            # S1 is typically louder than S2
-            amplitudes = [np.max(y_normalized[max(0, p-int(0.05*sr)):min(len(y_normalized), p+int(0.05*sr))]) for p in peak_samples]
-            
-            # Group peaks into likely cardiac cycles
-            for i in range(0, len(peak_samples)-3, 2):
-                start_idx = peak_samples[i]
-                # We want to capture a complete cardiac cycle S1-S2-S1
-                end_idx = peak_samples[i+2]
-                if end_idx > start_idx and end_idx < len(y_normalized):
-                    segments.append(y_normalized[start_idx:end_idx])
+            # If too few peaks detected, fall back to the original method
+            if len(peaks) < 4:  # Need at least 2 complete heart cycles
+                logger.info("Adaptive peak detection found too few peaks. Falling back to fixed parameters.")
+                peaks = pick_peaks(
+                    onset_env,
+                    pre_max=max(1, int(0.05*sr/hop_length)),
+                    post_max=max(1, int(0.05*sr/hop_length)),
+                    pre_avg=max(1, int(0.1*sr/hop_length)),
+                    post_avg=max(1, int(0.1*sr/hop_length)),
+                    delta=0.07,
+                    wait=max(1, int(0.25*sr/hop_length))
+                )
         
-        if segments:
-            # Select the median length segment as representative
-            segment_lengths = [len(s) for s in segments]
-            median_idx = np.argsort(segment_lengths)[len(segment_lengths)//2]
-            return segments[median_idx], sr, y_normalized, onset_env, peaks
-        else:
-            # Return full audio if segmentation failed
-            print("Warning: Segmentation failed. Using full audio.")
-            return y_normalized, sr, y_normalized, onset_env, peaks
+        return segment_cycles(y_normalized, sr, onset_env, peaks)
             
     except Exception as e:
-        print(f"Preprocessing error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Preprocessing error: %s", e)
         return None, None, None, None, None
     
+def cycle_bounds(peaks, onset_env, sr, n_samples):
+    """Sample bounds (n, 2) of the S1-S2-S1 cycles in the picked peak frames
+    
+    The one cycle set behind both the recording-level segment
+    (segment_cycles) and the per-cycle timeline rows (cardiac_cycles).
+    """
+    # Convert frame indices to sample indices
+    peak_times = librosa.frames_to_time(peaks, sr=sr, hop_length=HOP_LENGTH)
+    peak_samples = (peak_times * sr).astype(int)
+    if len(peak_samples) < 4:
+        return np.empty((0, 2), dtype=int)
+    
+    # Identify S1/S2 using spacing (systole shorter than diastole)
+    # and amplitude (S1 is typically louder than S2)
+    labels = label_heart_sounds(peak_times, onset_env[peaks])
+    first_s1 = int(np.argmax(labels == S1))
+    
+    # Group peaks into likely cardiac cycles starting at an S1: each
+    # complete S1-S2-S1 cycle runs from peak i to peak i+2
+    starts = np.arange(first_s1, len(peak_samples) - 3, 2)
+    bounds = np.column_stack((peak_samples[starts], peak_samples[starts + 2]))
+    return bounds[(bounds[:, 1] > bounds[:, 0]) & (bounds[:, 1] < n_samples)]
+
+def segment_cycles(y_normalized, sr, onset_env, peaks):
+    """preprocess_signal outputs from the picked S1/S2 peak frames: the
+    median-length S1-S2-S1 cycle, or the whole recording if none is found"""
+    # Segment into cardiac cycles with more reliable peak detection
+    segments = [y_normalized[start:end] for start, end in cycle_bounds(peaks, onset_env, sr, len(y_normalized))]
+    
+    if segments:
+        # Select the median length segment as representative
+        segment_lengths = [len(s) for s in segments]
+        median_idx = np.argsort(segment_lengths)[len(segment_lengths)//2]
+        return segments[median_idx], sr, y_normalized, onset_env, peaks
+    else:
+        # Return full audio if segmentation failed
+        logger.warning("Segmentation failed. Using full audio.")
+        return y_normalized, sr, y_normalized, onset_env, peaks
+
+def fast_segmentation(y_normalized, sr, plan):
+    """preprocess_signal outputs for the fast tier
+    
+    The smoothed Hilbert envelope, sampled at the frame rate, stands in for
+    the HPSS onset-strength curve, and peaks are picked with the fixed
+    parameters of the full path's fallback instead of tempo-adapted ones
+    (no beat tracking).
+    """
+    n = len(y_normalized)
+    with profiler.stage("hilbert"):
+        envelope = np.abs(hilbert(y_normalized, next_fast_len(n))[:n])
+        envelope = filtfilt(plan.smoothing_kernel, 1, envelope).astype(y_normalized.dtype, copy=False)
+    # Log compression keeps quieter S2s (and whole quieter recordings) above
+    # the threshold when one sound dominates the peak
+    onset_env = np.log1p(envelope[::HOP_LENGTH] / max(float(np.median(envelope)), np.finfo(envelope.dtype).tiny))
+    onset_env /= max(float(onset_env.max()), np.finfo(onset_env.dtype).tiny)
+    peaks = pick_peaks(
+        onset_env,
+        pre_max=max(1, int(0.05*sr/HOP_LENGTH)),
+        post_max=max(1, int(0.05*sr/HOP_LENGTH)),
+        pre_avg=max(1, int(0.1*sr/HOP_LENGTH)),
+        post_avg=max(1, int(0.1*sr/HOP_LENGTH)),
+        delta=FAST_PEAK_DELTA,
+        wait=max(1, int(0.25*sr/HOP_LENGTH))
+    )
+    return segment_cycles(y_normalized, sr, onset_env, peaks)
+
+def ecg_gated_segmentation(y_normalized, sr, r_peak_times, plan):
+    """preprocess_signal outputs with S1/S2 placed from ECG R peaks"""
+    # Rectified, smoothed signal is enough once the R peaks bound the search
+    envelope = filtfilt(plan.smoothing_kernel, 1, np.abs(y_normalized)).astype(y_normalized.dtype, copy=False)
+    s1, s2 = ecg_gated_heart_sounds(envelope, sr, r_peak_times)
+    
+    # Frame-rate envelope and alternating S1/S2 peak frames, as the acoustic path returns
+    onset_env = envelope[::HOP_LENGTH]
+    peaks = np.minimum(np.round(np.column_stack((s1, s2)).ravel() / HOP_LENGTH).astype(int), len(onset_env) - 1)
+    
+    # One cycle per R-R interval, from each S1 to the next
+    segments = [y_normalized[start:end] for start, end in zip(s1[:-1], s1[1:]) if end > start]
+    if not segments:
+        logger.warning("ECG gating found no complete cycle. Using full audio.")
+        return y_normalized, sr, y_normalized, onset_env, peaks
+    segment_lengths = [len(s) for s in segments]
+    median_idx = np.argsort(segment_lengths)[len(segment_lengths)//2]
+    return segments[median_idx], sr, y_normalized, onset_env, peaks
+
 def select_optimal_features(features):
     """Select optimal feature set for heart sound classification"""
     
-    # Essential timing features
+    # Essential timing features, plus rhythm regularity and HRV
     timing_features = {
         k: features[k] for k in [
             'HeartRate',
             'Systole_Mean', 'Systole_Std',
-            'Diastole_Mean', 'Diastole_Std'
+            'Diastole_Mean', 'Diastole_Std',
+            'Cycle_Std', 'SystoleDiastole_Ratio',
+            'HRV_RMSSD', 'HRV_pNN50',
+            'Alternation_Score'
         ] if k in features
     }
     
@@ -206,141 +417,349 @@ def select_optimal_features(features):
         **wavelet_features
     }
 
-def extract_features(file_path, segmentation_file=None):
-    """Cardiac-specific feature extraction with preprocessing and validation"""
+def aggregate_valve_features(valve_features):
+    """Build one patient-level feature vector from per-valve recordings
+    
+    valve_features maps a valve ("AV", "MV", ...) to the feature dicts of its
+    recordings. Each valve is summarized by the median across its files and
+    its keys are prefixed with the valve name (e.g. "MV_HeartRate").
+    """
+    patient_features = {}
+    for valve, feature_dicts in valve_features.items():
+        if not feature_dicts:
+            continue
+        # Use median instead of mean for robustness
+        medians = pd.DataFrame(feature_dicts).median()
+        for key, value in medians.items():
+            patient_features[f"{valve}_{key}"] = float(value)
+    return patient_features
+
+def compute_heartbeat_features(peaks, sr):
+    """Rhythm and heart-rate-variability features from the detected S1/S2 peak frames (see rhythm.py)"""
+    return rhythm_features(librosa.frames_to_time(peaks, sr=sr, hop_length=HOP_LENGTH))
+
+def compute_wavelet_features(signal, sr, wavelet='db4', levels=4):
+    """Extract comprehensive wavelet features for heart sound analysis"""
+    # Perform wavelet decomposition
+    coeffs = pywt.wavedec(signal, wavelet, level=levels)
+    
+    wavelet_features = {}
+    
+    # For each decomposition level
+    for i, c in enumerate(coeffs):
+        # Energy features
+        wavelet_features[f'Wavelet_{i}_Energy'] = float(np.sum(c**2))
+        
+        # Shannon entropy
+        normalized_c = c**2 / (np.sum(c**2) + 1e-12)
+        wavelet_features[f'Wavelet_{i}_Shannon'] = float(-np.sum(normalized_c * np.log2(normalized_c + 1e-12)))
+        
+        # Ratio between adjacent scales (helps detect transients like S1/S2)
+        if i < len(coeffs)-1:
+            energy_ratio = np.sum(c**2) / (np.sum(coeffs[i+1]**2) + 1e-12)
+            wavelet_features[f'Wavelet_{i}_EnergyRatio'] = float(energy_ratio)
+    
+    return wavelet_features
+
+def plan_feature_groups(feature_names=None):
+    """Feature groups compute_features must run to produce feature_names
+    
+    Names may carry a valve prefix ("MV_HeartRate") as in patient-level
+    models. None means every group (training and the full model).
+    """
+    if feature_names is None:
+        return set(FEATURE_GROUPS)
+    return {group for name in feature_names for group, matches in FEATURE_GROUPS.items() if matches(name)}
+
+def compute_features(preprocessed_audio, sr, peaks, groups=None, single_spectrogram=False):
+    """Compute the feature set for a preprocessed segment and its detected peaks
+    
+    groups (see plan_feature_groups) limits the work to the feature groups a
+    model actually uses; None computes all of them. single_spectrogram
+    (fast tier) takes the MFCCs from the SPECTRAL_HOP spectrogram instead of
+    a second STFT on the segmentation hop.
+    """
+    groups = set(FEATURE_GROUPS) if groups is None else groups
+    features = {}
+    
+    plan = get_dsp_plan(sr, dtype=preprocessed_audio.dtype)
+    
+    # MFCCs (13 coefficients from 26 mel bands), on the segmentation hop
+    if "mfcc" in groups and not single_spectrogram:
+        with profiler.stage("mfcc"):
+            mfccs = plan.mfcc(plan.stft_magnitude(preprocessed_audio))
+        features.update({f"MFCC_mean_{i+1}": float(v) for i, v in enumerate(np.mean(mfccs, axis=1))})
+    
+    # Heartbeat timing features
+    if "timing" in groups:
+        features.update(compute_heartbeat_features(peaks, sr))
+    
+    # One magnitude spectrogram shared by every spectral feature
+    if groups & SPECTRAL_GROUPS or ("mfcc" in groups and single_spectrogram):
+        with profiler.stage("spectrogram"):
+            spec = plan.stft_magnitude(preprocessed_audio, SPECTRAL_HOP)
+    
+    # Energy per band, summed over its frequency bins
+    if "energy" in groups:
+        for low, high in ENERGY_BANDS:
+            features[f"Energy_{low}_{high}Hz"] = float(np.sum(np.mean(spec[plan.band_slice(low, high)], axis=1)))
+
+    if "wavelet" in groups:
+        with profiler.stage("wavelet"):
+            features.update(compute_wavelet_features(preprocessed_audio, sr))
+
+    # Q-Factor
+    if "q_factor" in groups:
+        peak_freq = plan.fft_freqs[np.argmax(np.mean(spec, axis=1))]
+        bandwidth = librosa.feature.spectral_bandwidth(S=spec)[0].mean()
+        features['Q_Factor'] = float(peak_freq / bandwidth if bandwidth > 0 else 0)
+
+    if "flatness" in groups:
+        features['SpectralFlatness'] = float(np.mean(librosa.feature.spectral_flatness(S=spec)))
+    
+    if "zcr" in groups:
+        features["ZeroCrossingRate"] = float(np.mean(librosa.feature.zero_crossing_rate(preprocessed_audio)))
+    
+    # Last, since mfcc() squares the spectrogram in place
+    if "mfcc" in groups and single_spectrogram:
+        with profiler.stage("mfcc"):
+            mfccs = plan.mfcc(spec)
+        features.update({f"MFCC_mean_{i+1}": float(v) for i, v in enumerate(np.mean(mfccs, axis=1))})
+    
+    return features
+
+def cardiac_cycles(peaks, onset_env, sr, n_samples, window_s=TIMELINE_WINDOW_S):
+    """Sample bounds (n, 2) of every S1-S2-S1 cycle, or of fixed half-overlapping
+    windows when too few peaks were found to segment the recording"""
+    bounds = cycle_bounds(peaks, onset_env, sr, n_samples)
+    if len(bounds):
+        return bounds
+    
+    window = int(window_s * sr)
+    starts = np.arange(0, max(n_samples - window, 0) + 1, window // 2)
+    return np.column_stack((starts, np.minimum(starts + window, n_samples)))
+
+def compute_cycle_features(y, sr, peaks, bounds):
+    """Selected features for many segments of one recording as a DataFrame
+    
+    Row i matches select_optimal_features(compute_features(y[start:end], sr,
+    peaks)) for bounds[i], but the frames of all segments go through one
+    batched FFT per hop and every spectral feature is a per-segment mean over
+    per-frame values, so there is no per-segment spectrogram setup. Only the
+    short time-domain features (wavelets, zero crossings) are per segment.
+    """
+    plan = get_dsp_plan(sr, dtype=y.dtype)
+    spec, offsets = plan.segment_stft_magnitudes(y, bounds, SPECTRAL_HOP)
+    spec_mfcc, mfcc_offsets = plan.segment_stft_magnitudes(y, bounds)
+    
+    def segment_means(frame_values, offsets):
+        counts = np.diff(np.append(offsets, frame_values.shape[-1]))
+        return np.add.reduceat(frame_values, offsets, axis=-1, dtype=np.float64) / counts
+    
+    # Per-frame descriptors with the same settings as compute_features
+    frame_values = np.vstack([
+        librosa.feature.spectral_bandwidth(S=spec),
+        librosa.feature.spectral_flatness(S=spec),
+        *[spec[plan.band_slice(low, high)].sum(axis=0, keepdims=True) for low, high in ENERGY_BANDS]
+    ])
+    bandwidth, flatness, *band_energies = segment_means(frame_values, offsets)
+    
+    # Q-Factor: peak of each segment's mean spectrum over its mean bandwidth
+    peak_freq = plan.fft_freqs[np.argmax(segment_means(spec, offsets), axis=0)]
+    q_factor = np.where(bandwidth > 0, peak_freq / np.where(bandwidth > 0, bandwidth, 1), 0)
+    
+    columns = {
+        "Q_Factor": q_factor,
+        "SpectralFlatness": flatness,
+        "ZeroCrossingRate": [np.mean(librosa.feature.zero_crossing_rate(y[start:end])) for start, end in bounds],
+        **{f"MFCC_mean_{i+1}": v for i, v in enumerate(segment_means(plan.segment_mfcc(spec_mfcc, mfcc_offsets), mfcc_offsets))},
+        **{f"Energy_{low}_{high}Hz": e for (low, high), e in zip(ENERGY_BANDS, band_energies)}
+    }
+    for key, value in compute_heartbeat_features(peaks, sr).items():
+        columns[key] = np.full(len(bounds), value)
+    
+    wavelets = pd.DataFrame([compute_wavelet_features(y[start:end], sr) for start, end in bounds])
+    rows = pd.concat([pd.DataFrame(columns), wavelets], axis=1)
+    return rows[list(select_optimal_features(rows.iloc[0].to_dict()))]
+
+def extract_features_chunked(file_path, sr=ANALYSIS_SR, quality_gate=True,
+                             window_s=CHUNK_WINDOW_S, overlap_s=CHUNK_OVERLAP_S, precision=DSP_PRECISION,
+                             feature_names=None, tier="full"):
+    """Bounded-memory feature extraction for long and continuous recordings
+    
+    Each overlapping window is quality-checked, preprocessed and featurized on
+    its own, and only running per-feature sums are carried between windows.
+    Peak memory therefore depends on the window length, not on the recording
+    duration. Features are averaged over the usable windows.
+    """
     try:
-        if not os.path.exists(file_path):
-            return {"error": f"File not found: {file_path}"}
+        groups = plan_feature_groups(feature_names)
+        sums = {}
+        counts = {}
+        n_windows = 0
+        n_rejected = 0
+        last_reason = "no analyzable window"
+        
+        for start_time, y, window_sr in iter_audio_windows(file_path, sr, window_s, overlap_s):
+            n_windows += 1
+            if quality_gate:
+                with profiler.stage("quality"):
+                    quality = assess_signal_quality(y, window_sr)
+                if not quality["ok"]:
+                    # Skip windows where the stethoscope slipped, keep the rest
+                    n_rejected += 1
+                    last_reason = quality["reason"]
+                    continue
             
-        # Preprocess audio
-        preprocessed_audio, sr, full_audio, onset_env, peaks = preprocess_heart_sound(file_path)
-        if preprocessed_audio is None:
-            return {"error": "Preprocessing failed"}, {}
+            with profiler.stage("preprocess"):
+                preprocessed_audio, _, _, _, peaks = preprocess_signal(y, window_sr, precision, tier=tier)
+            if preprocessed_audio is None:
+                n_rejected += 1
+                continue
+            
+            with profiler.stage("features"):
+                window_features = select_optimal_features(compute_features(
+                    preprocessed_audio, window_sr, peaks, groups, single_spectrogram=tier == "fast"
+                ))
+            for key, value in window_features.items():
+                sums[key] = sums.get(key, 0.0) + value
+                counts[key] = counts.get(key, 0) + 1
         
-        # Initialize features early to avoid undefined variable issues
-        features = {}
-        validation_info = {}
+        if not counts:
+            return {"error": f"Unusable recording: {last_reason}"}, {}
         
-        # MFCCs
-        mfccs = librosa.feature.mfcc(
-        y=preprocessed_audio, 
-        sr=sr, 
-        n_mfcc=13,          # Changed from 13 to 25
-        n_mels=26,          # Custom Mel banks (closer to study's "25–42")
-        hop_length=256      # Match segmentation hop_length
-    )
-        mfccs_mean = np.mean(mfccs.T, axis=0)
-        mfccs_std = np.std(mfccs.T, axis=0)
+        features = {key: sums[key] / counts[key] for key in sums}
+        validation_info = {
+            "Windows_Analyzed": n_windows - n_rejected,
+            "Windows_Rejected": n_rejected
+        }
+        return features, validation_info
+    
+    except Exception as e:
+        return {"error": f"Feature extraction error: {str(e)}"}, {}
+
+def extract_feature_timeline(file_path, sr=ANALYSIS_SR, quality_gate=True, precision=DSP_PRECISION,
+                             feature_names=None, tier="full"):
+    """Recording-level features plus one feature row per cardiac cycle
+    
+    Returns (features, timeline) where features are what extract_features
+    returns and timeline is a DataFrame with the Start/End time (seconds)
+    of each cycle (or fixed window, see cardiac_cycles) followed by its
+    features, ready for one batched predict_proba call. The recording is
+    loaded and preprocessed once for both. feature_names limits the
+    recording-level features and tier selects the pipeline as in
+    extract_features. On failure returns
+    ({"error": ...}, None).
+    """
+    try:
+        if not hasattr(file_path, "read") and not os.path.exists(file_path):
+            return {"error": f"File not found: {file_path}"}, None
         
-        # Heartbeat timing features
-        hop_length = 256  # Must match preprocessing value
-        peak_times = librosa.frames_to_time(peaks, sr=sr, hop_length=hop_length)
+        y, sr = load_audio(file_path, sr)
+        if quality_gate:
+            quality = assess_signal_quality(y, sr)
+            if not quality["ok"]:
+                return {"error": f"Unusable recording: {quality['reason']}"}, None
         
-        heartbeat_features = {}
-        if len(peak_times) >= 2:
-            intervals = np.diff(peak_times)
-
-            # Group intervals into pairs (S1-S2 + S2-S1 = one complete cycle)
-            cycle_intervals = []
-            for i in range(0, len(intervals)-1, 2):
-                cycle_intervals.append(intervals[i] + intervals[i+1])
-            
-            systole_times = intervals[::2] if len(intervals) > 1 else []
-            diastole_times = intervals[1::2] if len(intervals) > 1 else []
-            
-            if len(systole_times) > 0:
-                heartbeat_features.update({
-                    "Systole_Mean": float(np.mean(systole_times)),
-                    "Systole_Std": float(np.std(systole_times))
-                })
-            if len(diastole_times) > 0:
-                heartbeat_features.update({
-                    "Diastole_Mean": float(np.mean(diastole_times)),
-                    "Diastole_Std": float(np.std(diastole_times))
-                })
-            # Calculate heart rate using complete cardiac cycles
-            heartbeat_features["HeartRate"] = float(60/np.mean(cycle_intervals) if cycle_intervals else 
-                                                60/np.mean(intervals)/2)  # Divide by 2 if using raw intervals
+        preprocessed_audio, sr, full_audio, onset_env, peaks = preprocess_signal(y, sr, precision, tier=tier)
+        if preprocessed_audio is None:
+            return {"error": "Preprocessing failed"}, None
         
-        # Spectral features
-        spectral_contrast = librosa.feature.spectral_contrast(
-            y=preprocessed_audio, sr=sr, fmin=20.0, n_bands=3
+        features = select_optimal_features(
+            compute_features(preprocessed_audio, sr, peaks, plan_feature_groups(feature_names),
+                             single_spectrogram=tier == "fast")
         )
-        spectral_contrast_mean = np.mean(spectral_contrast, axis=1)
         
-        # Broader, physiologically relevant energy bands
-        bands = [
-            (20, 100),   # S1 fundamental frequencies
-            (100, 200),  # S2 fundamental frequencies
-            (200, 400)   # Murmur frequencies
-        ]
-        band_energies = []
-        for low, high in bands:
-            spec = np.abs(librosa.stft(preprocessed_audio))
-            freq_bins = librosa.fft_frequencies(sr=sr)
-            idx_low = np.searchsorted(freq_bins, low)
-            idx_high = np.searchsorted(freq_bins, high)
-            band_energy = np.sum(np.mean(spec[idx_low:idx_high], axis=1))
-            band_energies.append(band_energy)
-
-        # Add wavelet decomposition
-        def compute_wavelet_features(signal, sr, wavelet='db4', levels=4):
-            """Extract comprehensive wavelet features for heart sound analysis"""
-            # Perform wavelet decomposition
-            coeffs = pywt.wavedec(signal, wavelet, level=levels)
-            
-            wavelet_features = {}
-            
-            # For each decomposition level
-            for i, c in enumerate(coeffs):
-                # Energy features
-                wavelet_features[f'Wavelet_{i}_Energy'] = float(np.sum(c**2))
-                
-                # Shannon entropy
-                normalized_c = c**2 / (np.sum(c**2) + 1e-12)
-                wavelet_features[f'Wavelet_{i}_Shannon'] = float(-np.sum(normalized_c * np.log2(normalized_c + 1e-12)))
-                
-                # Ratio between adjacent scales (helps detect transients like S1/S2)
-                if i < len(coeffs)-1:
-                    energy_ratio = np.sum(c**2) / (np.sum(coeffs[i+1]**2) + 1e-12)
-                    wavelet_features[f'Wavelet_{i}_EnergyRatio'] = float(energy_ratio)
-            
-            return wavelet_features
-
-        wavelet_features = compute_wavelet_features(preprocessed_audio, sr)
-        features.update(wavelet_features)
-
-        # Q-Factor
-        def compute_q_factor(signal, sr):
-            spec = np.abs(librosa.stft(signal))
-            freq_bins = librosa.fft_frequencies(sr=sr)
-            peak_freq = freq_bins[np.argmax(np.mean(spec, axis=1))]
-            bandwidth = librosa.feature.spectral_bandwidth(S=spec)[0].mean()
-            return float(peak_freq / bandwidth if bandwidth > 0 else 0)
-        
-        features['Q_Factor'] = compute_q_factor(preprocessed_audio, sr)
+        bounds = cardiac_cycles(peaks, onset_env, sr, len(full_audio))
+        timeline = compute_cycle_features(full_audio, sr, peaks, bounds)
+        timeline.insert(0, "Start", bounds[:, 0] / sr)
+        timeline.insert(1, "End", bounds[:, 1] / sr)
+        return features, timeline
+    
+    except Exception as e:
+        return {"error": f"Feature extraction error: {str(e)}"}, None
 
-        # Additional spectral features
-        spectral_flatness = librosa.feature.spectral_flatness(y=preprocessed_audio)
-        features['SpectralFlatness'] = float(np.mean(spectral_flatness))
+def extract_features(file_path, segmentation_file=None, sr=ANALYSIS_SR, quality_gate=True, chunked=None,
+                     precision=DSP_PRECISION, ecg=None, ecg_sr=ECG_SR, plot_jobs=None, feature_names=None,
+                     tier="full", peak_times=None):
+    """Cardiac-specific feature extraction with preprocessing and validation
+    
+    file_path is a WAV/FLAC path or a file-like object with the encoded
+    bytes. Audio is analyzed at sr (see ANALYSIS_SR); pass the analysis_sr stored
+    in the model metadata so features match the ones the model was trained on.
+    With quality_gate, unusable recordings are rejected up front with an
+    actionable error (see signal_quality.assess_signal_quality).
+    
+    chunked selects the windowed mode of extract_features_chunked; by default
+    it is used for recordings longer than LONG_RECORDING_S (segmentation
+    validation needs the whole file, so it disables the windowed mode).
+    
+    precision is the floating-point dtype of the DSP pipeline ("float32" by
+    default, "float64" for the original double-precision path).
+    
+    ecg is an optional ECG channel sampled at ecg_sr and starting together
+    with the audio (see ecg.resample_ecg for timestamped BLE samples). Its R
+    peaks gate the S1 windows; if too few are found the acoustic peak
+    search is used instead. ECG input disables the windowed mode.
+    
+    feature_names are the model's input columns; feature groups none of
+    them use are not computed (see plan_feature_groups). None computes all.
+    
+    tier is one of PIPELINE_TIERS: "fast" trades segmentation quality for
+    speed under load (its accuracy is calibrated per model at training).
+    
+    peak_times, if given, is a list the detected peak times (seconds) are
+    appended to. The rhythm features are then left to the caller, which
+    computes them for many recordings at once (rhythm.rhythm_features_batch),
+    and the windowed mode is disabled.
+    
+    With a segmentation file, validation metrics are returned and, if
+    plot_jobs is given (a list or a validation_plots.ValidationPlotter),
+    a plot job is appended to it for rendering after extraction.
+    """
+    try:
+        if not hasattr(file_path, "read") and not os.path.exists(file_path):
+            return {"error": f"File not found: {file_path}"}, {}
         
-        # Feature compilation
-        features.update({
-            # Timing and rhythm features
-            **heartbeat_features, 
-            
-            # Spectral features
-            **{f"MFCC_mean_{i+1}": float(v) for i, v in enumerate(mfccs_mean)},
-            **{f"MFCC_std_{i+1}": float(v) for i, v in enumerate(mfccs_std)},
-            **{f"SpectralContrast_{i+1}": float(v) for i, v in enumerate(spectral_contrast_mean)},
-            
-            # Energy distribution
-            **{f"Energy_{low}_{high}Hz": float(e) for (low, high), e in zip(bands, band_energies)},
+        if chunked is None:
+            chunked = (segmentation_file is None and ecg is None and peak_times is None
+                       and audio_duration(file_path) > LONG_RECORDING_S)
+        if chunked:
+            return extract_features_chunked(file_path, sr, quality_gate, precision=precision,
+                                            feature_names=feature_names, tier=tier)
+        
+        with profiler.stage("load"):
+            y, sr = load_audio(file_path, sr)
+        
+        # Reject clipped, silent or disconnected recordings before the heavy DSP
+        if quality_gate:
+            with profiler.stage("quality"):
+                quality = assess_signal_quality(y, sr)
+            if not quality["ok"]:
+                return {"error": f"Unusable recording: {quality['reason']}"}, {}
+        
+        # R peaks from the ECG channel replace the acoustic S1 search
+        r_peak_times = None
+        if ecg is not None:
+            r_peak_times = detect_r_peaks(ecg, ecg_sr)
+            if len(r_peak_times) < MIN_R_PEAKS:
+                logger.info("Too few R peaks in the ECG channel. Falling back to acoustic peak detection.")
+                r_peak_times = None
             
-            # Additional features
-            "ZeroCrossingRate": float(np.mean(librosa.feature.zero_crossing_rate(preprocessed_audio))),
-            "SpectralFlatness": float(np.mean(spectral_flatness))
-        })
+        # Preprocess audio
+        with profiler.stage("preprocess"):
+            preprocessed_audio, sr, full_audio, onset_env, peaks = preprocess_signal(y, sr, precision, r_peak_times, tier)
+        if preprocessed_audio is None:
+            return {"error": "Preprocessing failed"}, {}
+        
+        groups = plan_feature_groups(feature_names)
+        if peak_times is not None:
+            groups.discard("timing")
+            peak_times.append(librosa.frames_to_time(peaks, sr=sr, hop_length=HOP_LENGTH))
+        
+        with profiler.stage("features"):
+            features = compute_features(preprocessed_audio, sr, peaks, groups, single_spectrogram=tier == "fast")
+        hop_length = HOP_LENGTH  # Must match preprocessing value
         
         # If segmentation data provided, run validation
         validation_info = {}
@@ -356,34 +775,15 @@ def extract_features(file_path, segmentation_file=None):
                 s1_segments = segmentation[segmentation['segment_class'] == 1]
                 s2_segments = segmentation[segmentation['segment_class'] == 2]
                 
-                # Calculate matches
-                s1_matches = []
-                for _, row in s1_segments.iterrows():
-                    s1_start, s1_end = row['start_time'], row['end_time']
-                    # Add a small tolerance window
-                    tolerance = 0.1  # 100ms tolerance
-                    found = False
-                    for peak_time in peak_times_full:
-                        if (s1_start - tolerance) <= peak_time <= (s1_end + tolerance):
-                            found = True
-                            break
-                    s1_matches.append(found)
-                
-                s2_matches = []
-                for _, row in s2_segments.iterrows():
-                    s2_start, s2_end = row['start_time'], row['end_time']
-                    tolerance = 0.1  # 100ms tolerance
-                    found = False
-                    for peak_time in peak_times_full:
-                        if (s2_start - tolerance) <= peak_time <= (s2_end + tolerance):
-                            found = True
-                            break
-                    s2_matches.append(found)
+                # Calculate matches (100ms tolerance around each annotated segment)
+                s1_matches = match_segments(peak_times_full, s1_segments)
+                s2_matches = match_segments(peak_times_full, s2_segments)
                 
                 # Calculate validation metrics
-                s1_match_rate = sum(s1_matches) / len(s1_matches) if s1_matches else 0
-                s2_match_rate = sum(s2_matches) / len(s2_matches) if s2_matches else 0
-                total_match_rate = (sum(s1_matches) + sum(s2_matches)) / (len(s1_matches) + len(s2_matches)) if (s1_matches or s2_matches) else 0
+                s1_match_rate = float(s1_matches.mean()) if len(s1_matches) else 0
+                s2_match_rate = float(s2_matches.mean()) if len(s2_matches) else 0
+                n_segments = len(s1_matches) + len(s2_matches)
+                total_match_rate = float(s1_matches.sum() + s2_matches.sum()) / n_segments if n_segments else 0
                 
                 # Append validation info to features
                 validation_info = {
@@ -395,8 +795,18 @@ def extract_features(file_path, segmentation_file=None):
                     "Total_S2_Segments": len(s2_segments)
                 }
                 
-                # Create validation visualization
-                create_validation_plot(file_path, full_audio, sr, peak_times_full, segmentation)
+                # Hand the plot inputs to the caller's plotter instead of rendering here
+                if plot_jobs is not None:
+                    plot_jobs.append({
+                        "file_path": file_path,
+                        "audio": full_audio,
+                        "sr": sr,
+                        "peak_times": peak_times_full,
+                        "onset_env": onset_env,
+                        "segmentation": segmentation,
+                        "s1_matches": s1_matches,
+                        "s2_matches": s2_matches
+                    })
 
         features = select_optimal_features(features)
         
@@ -405,103 +815,20 @@ def extract_features(file_path, segmentation_file=None):
     except Exception as e:
         return {"error": f"Feature extraction error: {str(e)}"}, {}
 
-def create_validation_plot(file_path, audio, sr, detected_peaks, segmentation):
-    """Create an enhanced plot comparing detected peaks with segmentation data"""
-    plt.figure(figsize=(15, 10))
-    
-    # Create multiple subplots
-    gs = plt.GridSpec(3, 1, height_ratios=[2, 1, 1])
-    
-    # 1. Main waveform plot with segmentation
-    ax1 = plt.subplot(gs[0])
-    times = np.arange(len(audio)) / sr
-    ax1.plot(times, audio, color='grey', alpha=0.7, label='Waveform')
-    
-    # Plot detected peaks
-    for peak_time in detected_peaks:
-        ax1.axvline(x=peak_time, color='red', linestyle='--', alpha=0.7, 
-                   label='Detected Peak' if peak_time == detected_peaks[0] else '')
-    
-    # Plot segmentation with more informative color scheme
-    colors = {1: 'green', 2: 'blue', 3: 'purple', 4: 'orange', 0: 'grey'}
-    labels = {1: 'S1', 2: 'Systole', 3: 'S2', 4: 'Diastole', 0: 'Unknown'}
-    
-    legend_added = set()
-    
-    for _, row in segmentation.iterrows():
-        class_id = row['segment_class']
-        color = colors.get(class_id, 'grey')
-        label = labels.get(class_id, f'Class {class_id}')
-        
-        if class_id not in legend_added:
-            ax1.axvspan(row['start_time'], row['end_time'], alpha=0.3, color=color, label=label)
-            legend_added.add(class_id)
-        else:
-            ax1.axvspan(row['start_time'], row['end_time'], alpha=0.3, color=color)
-    
-    ax1.set_title(f'Heart Sound Analysis: {os.path.basename(file_path)}')
-    ax1.set_ylabel('Amplitude')
-    ax1.legend(loc='upper right')
-    ax1.grid(True, alpha=0.3)
-    
-    # 2. Spectrogram plot
-    ax2 = plt.subplot(gs[1], sharex=ax1)
-    D = librosa.amplitude_to_db(np.abs(librosa.stft(audio)), ref=np.max)
-    librosa.display.specshow(D, y_axis='log', x_axis='time', sr=sr, ax=ax2)
-    ax2.set_ylabel('Frequency (Hz)')
-    ax2.set_title('Spectrogram')
-    
-    # 3. Onset strength plot
-    ax3 = plt.subplot(gs[2], sharex=ax1)
-    hop_length = 256  # Make sure this matches what was used in preprocessing
-    onset_env = librosa.onset.onset_strength(y=audio, sr=sr, hop_length=hop_length)
-    times_onset = librosa.times_like(onset_env, sr=sr, hop_length=hop_length)
-    ax3.plot(times_onset, onset_env, label='Onset Strength')
-    ax3.set_ylabel('Strength')
-    ax3.set_xlabel('Time (s)')
-    ax3.set_title('Onset Strength')
-    
-    # Mark detected peaks on onset strength plot
-    frame_peaks = librosa.time_to_frames(detected_peaks, sr=sr, hop_length=hop_length)
-    for p in frame_peaks:
-        if p < len(onset_env):
-            ax3.plot(times_onset[p], onset_env[p], 'ro', markersize=8)
-    
-    plt.tight_layout()
-    
-    # Calculate accuracy statistics
-    s1_segments = segmentation[segmentation['segment_class'] == 1]
-    s2_segments = segmentation[segmentation['segment_class'] == 2]
-    
-    # Count true positives (peaks within segment boundaries)
-    s1_matches = sum(1 for _, row in s1_segments.iterrows() 
-                    if any(row['start_time'] <= p <= row['end_time'] for p in detected_peaks))
-    s2_matches = sum(1 for _, row in s2_segments.iterrows() 
-                    if any(row['start_time'] <= p <= row['end_time'] for p in detected_peaks))
-    
-    # Add accuracy stats to the plot
-    stats_text = (f"S1 Detection Rate: {s1_matches}/{len(s1_segments)} ({s1_matches/len(s1_segments)*100:.1f}%)\n"
-                 f"S2 Detection Rate: {s2_matches}/{len(s2_segments)} ({s2_matches/len(s2_segments)*100:.1f}%)\n"
-                 f"Total Peaks Detected: {len(detected_peaks)}")
-    
-    plt.figtext(0.02, 0.02, stats_text, fontsize=10, bbox=dict(facecolor='white', alpha=0.8))
-    
-    # Save plot
-    plot_file = os.path.splitext(file_path)[0] + '_validation.png'
-    plt.savefig(plot_file, dpi=300, bbox_inches='tight')
-    print(f"Enhanced validation plot saved to {plot_file}")
-    plt.close()
-
 if __name__ == "__main__":
+    setup_logging()
     try:
-        if len(sys.argv) < 2:
-            print(json.dumps({"error": "Usage: python extract_features.py <file.wav> [segmentation_file.txt]"}))
+        # --draft renders the validation plot at low resolution
+        args = [arg for arg in sys.argv[1:] if arg != "--draft"]
+        if len(args) < 1:
+            print(json.dumps({"error": "Usage: python extract_features.py <file.wav> [segmentation_file.txt] [--draft]"}))
             sys.exit(1)
         
-        wav_file = sys.argv[1]
-        segmentation_file = sys.argv[2] if len(sys.argv) > 2 else None
+        wav_file = args[0]
+        segmentation_file = args[1] if len(args) > 1 else None
         
-        features, validation = extract_features(wav_file, segmentation_file)
+        plot_jobs = []
+        features, validation = extract_features(wav_file, segmentation_file, plot_jobs=plot_jobs)
         
         if isinstance(features, dict):
             if "error" in features:
@@ -524,6 +851,11 @@ if __name__ == "__main__":
                 
                 print("\nJSON output:")
                 print(json.dumps(features))
+                
+                # Plot after the results are out, so it never delays them
+                if plot_jobs:
+                    from validation_plots import render_validation_plots
+                    render_validation_plots(plot_jobs, draft="--draft" in sys.argv)
             
     except Exception as e:
         print(json.dumps({"error": str(e)}))
\ No newline at end of file
@@ -0,0 +1,280 @@
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from structured_logging import setup_logging, correlation
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.environ.get("HEART_JOB_DB", "jobs.sqlite3")
+
+# Lower runs first; within a lane the owner served least recently goes next
+# (so one account's bulk backlog cannot starve the others, even with a
+# single worker), then submission order
+PRIORITY_LANES = {"interactive": 0, "bulk": 10}
+
+LEASE_S = 600           # A running job whose worker died is retried after this
+MAX_ATTEMPTS = 3
+POLL_INTERVAL_S = 0.5
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    idempotency_key TEXT UNIQUE,
+    owner TEXT NOT NULL,
+    batch_id TEXT,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority, created);
+CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, status);
+CREATE TABLE IF NOT EXISTS owners (
+    owner TEXT PRIMARY KEY,
+    last_served REAL NOT NULL
+);
+"""
+
+class JobError(Exception):
+    """Raised by job handlers for failures a retry cannot fix (bad input, unusable recording)"""
+
+class JobQueue:
+    """Durable job queue and result store in one SQLite file
+
+    Safe to share between the API processes and worker processes: every
+    method opens a short-lived connection, and claiming a job is a single
+    IMMEDIATE transaction so two workers never take the same job.
+    """
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Autocommit connection; claim() opens its own transaction
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _row_to_job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["priority"] = next((lane for lane, p in PRIORITY_LANES.items() if p == job["priority"]), job["priority"])
+        return job
+
+    def _insert(self, db, payload, owner, priority, idempotency_key, batch_id, status, worker=None):
+        key = f"{owner}:{idempotency_key}" if idempotency_key else None
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        running = status == RUNNING
+        cursor = db.execute(
+            "INSERT OR IGNORE INTO jobs (id, idempotency_key, owner, batch_id, priority, status, payload, attempts, "
+            "worker, lease_until, created, started) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, key, owner, batch_id, PRIORITY_LANES[priority], status, json.dumps(payload), int(running),
+             worker, now + LEASE_S if running else None, now, now if running else None)
+        )
+        created = cursor.rowcount == 1
+        if created:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        else:
+            row = db.execute("SELECT * FROM jobs WHERE idempotency_key = ?", (key,)).fetchone()
+        return self._row_to_job(row), created
+
+    def submit(self, payload, owner, priority="interactive", idempotency_key=None, batch_id=None):
+        """Queue a job; returns (job, created)
+
+        Idempotency keys are scoped to the owner. Resubmitting with a key
+        that is already known returns the existing job (queued, running or
+        finished) instead of queueing the work again.
+        """
+        return self.submit_many([payload], owner, priority, [idempotency_key], batch_id)[0]
+
+    def submit_many(self, payloads, owner, priority="interactive", idempotency_keys=None, batch_id=None):
+        """Queue several jobs in one transaction; returns [(job, created)] in order (see submit)"""
+        keys = idempotency_keys or [None] * len(payloads)
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                submitted = [self._insert(db, payload, owner, priority, key, batch_id, QUEUED)
+                             for payload, key in zip(payloads, keys)]
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return submitted
+
+    def reserve(self, payload, owner, idempotency_key, worker):
+        """Take an idempotency key for a request served synchronously; returns (job, created)
+
+        The new job is stored as running under worker's lease, so a retry
+        arriving meanwhile finds it in flight. Finish it with complete() or
+        fail(), or discard() it so a retry runs the request again. If the
+        serving process dies, the job workers pick it up once the lease
+        expires.
+        """
+        with self._connect() as db:
+            return self._insert(db, payload, owner, "interactive", idempotency_key, None, RUNNING, worker)
+
+    def discard(self, job_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def find(self, owner, idempotency_key):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE idempotency_key = ?",
+                             (f"{owner}:{idempotency_key}",)).fetchone()
+        return self._row_to_job(row)
+
+    def find_many(self, owner, idempotency_keys):
+        """Jobs for several keys in one query, None where a key is unknown"""
+        keys = [f"{owner}:{key}" for key in idempotency_keys]
+        with self._connect() as db:
+            rows = db.execute(f"SELECT * FROM jobs WHERE idempotency_key IN ({', '.join('?' * len(keys))})",
+                              keys).fetchall()
+        found = {row["idempotency_key"]: self._row_to_job(row) for row in rows}
+        return [found.get(key) for key in keys]
+
+    def get(self, job_id):
+        with self._connect() as db:
+            return self._row_to_job(db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def get_batch(self, batch_id):
+        with self._connect() as db:
+            rows = db.execute("SELECT * FROM jobs WHERE batch_id = ? ORDER BY created", (batch_id,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def claim(self, worker):
+        """Lease the most urgent ready job (or one whose lease expired) to worker"""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT jobs.* FROM jobs LEFT JOIN owners ON owners.owner = jobs.owner "
+                    "WHERE jobs.status = ? OR (jobs.status = ? AND jobs.lease_until < ?) "
+                    "ORDER BY jobs.priority, COALESCE(owners.last_served, 0), jobs.created LIMIT 1",
+                    (QUEUED, RUNNING, now)
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, lease_until = ?, "
+                        "started = COALESCE(started, ?) WHERE id = ?",
+                        (RUNNING, worker, now + LEASE_S, now, row["id"])
+                    )
+                    db.execute("INSERT OR REPLACE INTO owners (owner, last_served) VALUES (?, ?)",
+                               (row["owner"], now))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._row_to_job(row)
+        job["attempts"] += 1
+        return job
+
+    def complete(self, job_id, result):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = ?, result = ?, error = NULL, lease_until = NULL, finished = ? "
+                       "WHERE id = ?", (DONE, json.dumps(result), time.time(), job_id))
+
+    def fail(self, job_id, error, retry=False):
+        """Mark a job failed, or put it back in its lane when retry is allowed"""
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = ?, error = ?, lease_until = NULL, finished = ? WHERE id = ?",
+                       (QUEUED if retry else FAILED, error, None if retry else time.time(), job_id))
+
+    def depth(self):
+        """Queued jobs per lane"""
+        with self._connect() as db:
+            rows = db.execute("SELECT priority, COUNT(*) FROM jobs WHERE status = ? GROUP BY priority",
+                              (QUEUED,)).fetchall()
+        counts = dict(rows)
+        return {lane: counts.get(p, 0) for lane, p in PRIORITY_LANES.items()}
+
+    def depth_by_owner(self):
+        """Queued and running jobs per owner"""
+        with self._connect() as db:
+            rows = db.execute("SELECT owner, status, COUNT(*) FROM jobs WHERE status IN (?, ?) "
+                              "GROUP BY owner, status", (QUEUED, RUNNING)).fetchall()
+        owners = {}
+        for owner, status, count in rows:
+            owners.setdefault(owner, {QUEUED: 0, RUNNING: 0})[status] = count
+        return owners
+
+def worker_loop(handler, path=JOB_DB_PATH, poll_interval=POLL_INTERVAL_S):
+    """Claim and run jobs until the parent process exits; handler(payload)
+    returns a JSON-serializable result"""
+    setup_logging()
+    queue = JobQueue(path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    parent = os.getppid()
+    # Exit with the API process, even if it was killed without cleaning up
+    while os.getppid() == parent:
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        with correlation(job["id"][:16]):
+            if job["attempts"] > MAX_ATTEMPTS:
+                # Only reachable through expired leases: the job keeps killing its worker
+                queue.fail(job["id"], "Worker stopped while processing this job")
+                logger.error("Job abandoned", extra={"job_id": job["id"], "attempt": job["attempts"]})
+                continue
+            start = time.perf_counter()
+            try:
+                queue.complete(job["id"], handler(job["payload"]))
+                logger.info("Job done", extra={"job_id": job["id"], "lane": job["priority"],
+                                               "duration_ms": round(1000 * (time.perf_counter() - start), 1)})
+            except JobError as e:
+                queue.fail(job["id"], str(e))
+                logger.info("Job rejected", extra={"job_id": job["id"], "error": str(e)})
+            except Exception as e:
+                retry = job["attempts"] < MAX_ATTEMPTS
+                queue.fail(job["id"], f"{type(e).__name__}: {e}", retry=retry)
+                logger.exception("Job failed", extra={"job_id": job["id"], "attempt": job["attempts"], "retry": retry})
+
+def stop_workers(workers, timeout=5):
+    """Terminate worker processes; a job cut off mid-run is retried when its lease expires"""
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join(timeout)
+
+def start_workers(handler, n_workers, path=JOB_DB_PATH):
+    """Start n_workers daemon worker processes (spawned, so each loads its own model)"""
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for _ in range(n_workers):
+        process = context.Process(target=worker_loop, args=(handler, path), daemon=True)
+        process.start()
+        workers.append(process)
+    return workers
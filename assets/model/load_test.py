@@ -0,0 +1,203 @@
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from backends import LOCAL_TOKEN_PREFIX
+
+RSS_SAMPLE_INTERVAL_S = 0.5
+READY_TIMEOUT_S = 300
+# Per-user admission limits of the server started here: high enough that
+# the run measures extraction, not the rate limiter (see admission.py)
+LOAD_TEST_RATE_LIMIT = "1000"
+LOAD_TEST_RATE_BURST = "100000"
+
+def read_rss_mb(pid):
+    """Resident set size of a local process from /proc (None if unavailable)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+class RSSSampler(threading.Thread):
+    """Track peak RSS of every server worker PID seen in responses"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.pids = set()
+        self.peak = {}
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(RSS_SAMPLE_INTERVAL_S):
+            self.sample()
+
+    def sample(self):
+        for pid in list(self.pids):
+            rss = read_rss_mb(pid)
+            if rss is not None:
+                self.peak[pid] = max(self.peak.get(pid, 0.0), rss)
+
+    def stop(self):
+        self._stopped.set()
+        self.sample()
+
+def post_analyze(url, token, firebase_path, timeline=False, timeout=300):
+    """One /analyze call; returns (latency_s, status, worker_pid)"""
+    body = json.dumps({"firebase_path": firebase_path, "timeline": timeline}).encode()
+    request = urllib.request.Request(f"{url}/analyze", data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {token}"
+    })
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status, pid = response.status, response.headers.get("X-Worker-PID")
+    except urllib.error.HTTPError as e:
+        status, pid = e.code, e.headers.get("X-Worker-PID")
+    except (urllib.error.URLError, TimeoutError):
+        status, pid = 0, None
+    return time.perf_counter() - start, status, int(pid) if pid else None
+
+def usable_recordings(file_paths):
+    """Recordings that pass the server's quality gate (the others always get 400)"""
+    from extract_features import load_audio
+    from signal_quality import assess_signal_quality
+
+    usable = []
+    for file_path in file_paths:
+        y, sr = load_audio(file_path)
+        if assess_signal_quality(y, sr)["ok"]:
+            usable.append(file_path)
+    return usable
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q) * 1000) if len(latencies) else None
+
+def wait_until_ready(url, timeout=READY_TIMEOUT_S):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=5) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(1)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+def start_server(port, workers, bucket_dir):
+    """Run main.py under uvicorn with the local auth/storage backend"""
+    env = dict(os.environ, HEART_BACKEND="local", HEART_LOCAL_BUCKET=os.path.abspath(bucket_dir),
+               HEART_RATE_LIMIT=LOAD_TEST_RATE_LIMIT, HEART_RATE_BURST=LOAD_TEST_RATE_BURST)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        env=env
+    )
+
+def run_load(url, paths, concurrency, n_requests, n_users=None, timeline=False):
+    """Drive /analyze with n_requests calls at the given concurrency, cycling over paths
+
+    Requests are spread over n_users uids (default: one per concurrent
+    request), so per-user fair queuing does not serialize the run. 429
+    responses are counted as rate_limited and left out of the latency
+    percentiles.
+    """
+    tokens = [f"{LOCAL_TOKEN_PREFIX}loadtest-{u}" for u in range(n_users or concurrency)]
+    sampler = RSSSampler()
+    sampler.start()
+
+    def task(i):
+        result = post_analyze(url, tokens[i % len(tokens)], paths[i % len(paths)], timeline)
+        if result[2] is not None:
+            sampler.pids.add(result[2])
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(task, range(n_requests)))
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+
+    latencies = np.array([r[0] for r in results], dtype=float)
+    ok = np.array([r[1] == 200 for r in results], dtype=bool)
+    rate_limited = np.array([r[1] == 429 for r in results], dtype=bool)
+    # A 429 is a fast refusal, not an extraction; it would drag the percentiles down
+    latencies = latencies[~rate_limited]
+    per_worker = {}
+    for _, status, pid in results:
+        if pid is not None:
+            per_worker.setdefault(pid, 0)
+            per_worker[pid] += 1
+
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "errors": int((~ok & ~rate_limited).sum()),
+        "rate_limited": int(rate_limited.sum()),
+        "status_counts": {str(s): int(sum(r[1] == s for r in results)) for s in sorted({r[1] for r in results})},
+        "throughput_rps": n_requests / elapsed if n_requests else 0.0,
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "p99_ms": percentile_ms(latencies, 99),
+        "workers": {
+            str(pid): {"requests": count, "peak_rss_mb": round(sampler.peak.get(pid, float("nan")), 1)}
+            for pid, count in sorted(per_worker.items())
+        }
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test /analyze against the local (fake Firebase) backend")
+    parser.add_argument("--url", default=None, help="Running server; default starts one with HEART_BACKEND=local")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--server-workers", type=int, default=1, help="uvicorn workers when starting a server")
+    parser.add_argument("--recordings", default="test_recordings", help="Directory served as the bucket")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=50, help="Requests per concurrency level")
+    parser.add_argument("--timeline", action="store_true")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests before each run")
+    parser.add_argument("--users", type=int, default=None,
+                        help="Distinct uids to spread requests over (default: one per concurrent request)")
+    parser.add_argument("--include-rejected", action="store_true",
+                        help="Also send recordings the quality gate rejects")
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.recordings, "*.wav")))
+    if not args.include_rejected:
+        usable = usable_recordings(files)
+        for file_path in sorted(set(files) - set(usable)):
+            print(f"Skipping {os.path.basename(file_path)}: rejected by the quality gate", file=sys.stderr)
+        files = usable
+    paths = [f"users/loadtest/recordings/{os.path.basename(f)}" for f in files]
+    if not paths:
+        sys.exit(f"No usable recordings in {args.recordings}")
+
+    server = None
+    url = args.url
+    if url is None:
+        server = start_server(args.port, args.server_workers, args.recordings)
+        url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_ready(url)
+        for concurrency in args.concurrency:
+            if args.warmup:
+                run_load(url, paths, concurrency, args.warmup, args.users, timeline=args.timeline)
+            report = run_load(url, paths, concurrency, args.requests, args.users, timeline=args.timeline)
+            print(json.dumps(report))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
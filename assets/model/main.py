@@ -1,17 +1,42 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
-from fastapi import Body
+import os
+
+# Persist numba-compiled librosa internals across restarts. Must be set
+# before librosa is imported.
+os.environ.setdefault(
+    "NUMBA_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".numba_cache")
+)
+
+from fastapi import FastAPI, HTTPException, Depends
+from fastapi import Body, Header
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
-import firebase_admin
-from firebase_admin import credentials, storage, auth
-from extract_features import extract_features
+from extract_features import extract_features, extract_feature_timeline, load_model_metadata, ANALYSIS_SR, AUDIO_EXTENSIONS
+from synthetic_signals import synthetic_heart_sound
+from structured_logging import setup_logging, correlation, new_request_id
+from backends import get_backend, AuthError, RecordingNotFound
+from job_queue import JobQueue, JobError, start_workers, stop_workers, PRIORITY_LANES, QUEUED, RUNNING, DONE, FAILED
+from predict_heart_murmur import MODEL_PATH, COMPACT_MODEL_PATH
+from drift_monitor import FeatureDriftMonitor
+from early_exit import EarlyExitForest, split_pipeline
+from admission import RateLimiter, FairScheduler, AdmissionRejected, tenant_key, BURST
+from tiers import TierSelector, SERVING_TIERS
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import asyncio
+import io
+import logging
 import joblib
 import numpy as np
-import librosa
-import tempfile
-import os
+import soundfile as sf
+import socket
+import threading
+import time
 import pandas as pd
 
+# JSON logs through a background writer; records carry the request ID
+setup_logging()
+logger = logging.getLogger("heart_api")
+
 app = FastAPI()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -22,57 +47,430 @@ app.add_middleware(
     allow_origins=["*"],  # For development only - tighten for production
     allow_credentials=True,
     allow_methods=["POST", "GET"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_headers=["Authorization", "Content-Type", "Idempotency-Key", "X-Request-ID"],
+    expose_headers=["Retry-After"],
 )
 
-# Initialize Firebase
-cred = credentials.Certificate("service-account.json")
-firebase_admin.initialize_app(cred, {'storageBucket': 'respirhythm.firebasestorage.app'})
+# Auth and storage (Firebase, or local fakes with HEART_BACKEND=local)
+backend = get_backend()
 
-# Load trained model
-model = joblib.load('heart_sound_model.joblib')
+# Load trained model ("compact" serves the feature-budgeted variant)
+HEART_MODEL = os.environ.get("HEART_MODEL", "full")
+model = joblib.load(COMPACT_MODEL_PATH if HEART_MODEL == "compact" else MODEL_PATH)
+metadata = load_model_metadata()
+analysis_sr = metadata["analysis_sr"]
+# The compact model also backs the degraded tiers (see tiers.SERVING_TIERS)
+models = {"full": model}
+if os.path.exists(COMPACT_MODEL_PATH):
+    models["compact"] = joblib.load(COMPACT_MODEL_PATH)
+# Only the feature groups each model reads are extracted
+model_features = {}
+for name, m in models.items():
+    columns = getattr(m, "feature_names_in_", None)
+    model_features[name] = list(columns) if columns is not None else None
 
-@app.post("/analyze")
-async def analyze_heart_sound(firebase_path: str = Body(..., embed=True), token: str = Depends(oauth2_scheme)):
-    try:
-        # Verify Firebase Auth token
-        decoded_token = auth.verify_id_token(token)
-        uid = decoded_token['uid']
-
-        # Validate file path format
-        if not firebase_path.startswith('users/'):
-            raise HTTPException(400, "Invalid file path format")
-
-        # 1. Download audio from Firebase
-        bucket = storage.bucket()
-        blob = bucket.blob(firebase_path)
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
-        blob.download_to_filename(temp_file.name)
-        temp_file.close()  # Explicitly close the file
-        
-        # 2. Extract features
-        features, _ = extract_features(temp_file.name)
+# HEART_EARLY_EXIT=1 stops evaluating trees once the decision is settled
+early_exit = ({name: EarlyExitForest(m) for name, m in models.items()}
+              if os.environ.get("HEART_EARLY_EXIT") == "1" else {})
+n_trees = {name: len(split_pipeline(m)[1].estimators_) for name, m in models.items()}
+
+# Pipeline tier per request, from queue depth or the client's latency budget
+tier_selector = TierSelector(metadata.get("tiers", {}))
+
+# Served feature distributions vs. the training reference (None without one)
+drift = FeatureDriftMonitor.load()
+
+# Durable job queue and result store shared with the worker processes
+jobs = JobQueue()
+JOB_WORKERS = int(os.environ.get("HEART_JOB_WORKERS", "1"))
+# Jobs per /jobs/batch call; each costs one rate-limit token, so a larger
+# batch could never be admitted
+MAX_BATCH_JOBS = BURST
+# Lease holder name for synchronous /analyze requests with an Idempotency-Key
+SERVER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# How long a retry waits for the in-flight request with the same key
+IDEMPOTENT_WAIT_S = 60
+IDEMPOTENT_POLL_S = 0.5
+
+# Per-user rate limits, and fair sharing of the extraction slots (per process)
+rate_limiter = RateLimiter()
+scheduler = FairScheduler()
+
+# Set once warm-up has run; /ready reports unhealthy until then
+app.state.ready = False
+
+def features_to_frame(features, model_name="full"):
+    """Model input in the column order the model was fitted with, from one
+    feature dict (one row) or a DataFrame of rows"""
+    X = features if isinstance(features, pd.DataFrame) else pd.DataFrame([features])
+    if model_features[model_name] is not None:
+        X = X.reindex(columns=model_features[model_name])
+    return X.fillna(0)
+
+def score(X, model_name="full"):
+    """Murmur probability and number of trees evaluated, per row of X"""
+    if model_name in early_exit:
+        return early_exit[model_name].predict_proba(X)
+    return models[model_name].predict_proba(X)[:, 1], np.full(len(X), n_trees[model_name])
+
+def warm_up():
+    """Run the full extraction and inference path once on a synthetic clip
+    
+    The first call compiles librosa's numba kernels (written to
+    NUMBA_CACHE_DIR, so later workers load them from disk) and touches the
+    model, so no user request pays that cost.
+    """
+    start = time.perf_counter()
+    sr = analysis_sr or ANALYSIS_SR
+    # Same in-memory decode path as /analyze
+    clip = io.BytesIO()
+    sf.write(clip, synthetic_heart_sound(sr=sr), sr, format="WAV")
+    for tier in tier_selector.available:
+        pipeline, model_name = SERVING_TIERS[tier]
+        features, _ = extract_features(clip, sr=analysis_sr, feature_names=model_features[model_name],
+                                       tier=pipeline)
         if "error" in features:
-            raise HTTPException(400, detail=features["error"])
-        
-        # 3. Format features for model
-        X = pd.DataFrame([features]).fillna(0)
-        
-        # 4. Make prediction
-        proba = model.predict_proba(X)[0][1]
-        prediction = "Abnormal" if proba > 0.5 else "Normal"
-        
-        # 5. Generate suggestions
-        suggestions = generate_clinical_suggestions(prediction, features)
-        
-        return {
-            "prediction": prediction,
-            "confidence": float(proba),
-            "suggestions": suggestions,
-            "features": features
+            raise RuntimeError(features["error"])
+        score(features_to_frame(features, model_name), model_name)
+    logger.info("Warm-up completed", extra={"duration_s": round(time.perf_counter() - start, 2)})
+
+def _run_warm_up():
+    try:
+        warm_up()
+    except Exception:
+        # Still serve: a failed warm-up only means the first request is slow
+        logger.exception("Warm-up failed")
+    app.state.ready = True
+
+@app.middleware("http")
+async def correlate_request(request, call_next):
+    """Tag every log record of a request with its ID (client-supplied X-Request-ID or a new one)"""
+    with correlation(request.headers.get("X-Request-ID") or new_request_id()) as rid:
+        start = time.perf_counter()
+        response = await call_next(request)
+        logger.info("Request handled", extra={
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "duration_ms": round(1000 * (time.perf_counter() - start), 1)
+        })
+    response.headers["X-Request-ID"] = rid
+    # Lets load tests attribute latency and memory to a server process
+    response.headers["X-Worker-PID"] = str(os.getpid())
+    return response
+
+@app.on_event("startup")
+async def start_background_work():
+    # Run off the event loop so the liveness probe answers during warm-up
+    threading.Thread(target=_run_warm_up, daemon=True).start()
+    # Started here rather than at import, since each spawned worker imports this module
+    app.state.job_workers = start_workers(run_analysis_job, JOB_WORKERS, jobs.path)
+
+@app.on_event("shutdown")
+async def stop_background_work():
+    stop_workers(app.state.job_workers)
+
+@app.get("/health")
+async def health():
+    """Liveness probe"""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: healthy only after warm-up"""
+    if not app.state.ready:
+        raise HTTPException(503, "Warming up")
+    return {"status": "ready"}
+
+@app.get("/metrics/drift")
+async def drift_metrics():
+    """Per-feature drift of this process's served features against the training set"""
+    if drift is None:
+        raise HTTPException(404, "No feature reference saved with the model")
+    return drift.report()
+
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """Per-tenant (pseudonymized uid) extraction queue depth here, and durable job backlog"""
+    backlog = await run_in_threadpool(jobs.depth_by_owner)
+    return {
+        "pid": os.getpid(),
+        **scheduler.metrics(),
+        "job_lanes": await run_in_threadpool(jobs.depth),
+        "job_tenants": {tenant_key(owner): counts for owner, counts in backlog.items()}
+    }
+
+class AnalysisError(JobError):
+    """The recording cannot be analyzed; reported to the client, never retried"""
+
+def validate_path(firebase_path):
+    if not firebase_path.startswith('users/'):
+        raise AnalysisError("Invalid file path format")
+    if not firebase_path.lower().endswith(AUDIO_EXTENSIONS):
+        raise AnalysisError("Unsupported audio format. Upload WAV or FLAC.")
+
+def run_analysis(firebase_path, timeline=False, tier="full"):
+    """Download, extract and score one recording; shared by /analyze and the job workers"""
+    validate_path(firebase_path)
+    pipeline, model_name = SERVING_TIERS[tier]
+    if model_name not in models:
+        model_name = "full"
+    feature_names = model_features[model_name]
+    
+    # 1. Download audio from storage straight into memory (WAV or FLAC,
+    # decoded by soundfile without a temporary file)
+    try:
+        audio = io.BytesIO(backend.download(firebase_path))
+    except RecordingNotFound:
+        raise AnalysisError("Recording not found")
+    
+    # 2. Extract features (plus one row per cardiac cycle in timeline mode)
+    start = time.perf_counter()
+    if timeline:
+        features, cycles = extract_feature_timeline(audio, sr=analysis_sr, feature_names=feature_names,
+                                                    tier=pipeline)
+    else:
+        features, _ = extract_features(audio, sr=analysis_sr, feature_names=feature_names, tier=pipeline)
+    if "error" in features:
+        raise AnalysisError(features["error"])
+    tier_selector.observe(tier, time.perf_counter() - start)
+    
+    # Fast-tier features are distributed differently from the training set
+    if drift is not None and pipeline == "full":
+        drift.update(features)
+    
+    # 3. Format features for model
+    X = features_to_frame(features, model_name)
+    
+    # 4. Make prediction
+    proba, trees = score(X, model_name)
+    proba = proba[0]
+    prediction = "Abnormal" if proba > 0.5 else "Normal"
+    
+    # 5. Generate suggestions
+    suggestions = generate_clinical_suggestions(prediction, features)
+    
+    response = {
+        "prediction": prediction,
+        "confidence": float(proba),
+        "trees_evaluated": int(trees[0]),
+        # Holdout accuracy of the pipeline/model tier that produced this result
+        "tier": tier,
+        "tier_calibration": metadata.get("tiers", {}).get(tier),
+        "suggestions": suggestions,
+        "features": features
+    }
+    
+    # 6. Murmur probability over time, all cycles scored in one call
+    if timeline:
+        cycle_proba, _ = score(features_to_frame(cycles.drop(columns=["Start", "End"]), model_name), model_name)
+        response["timeline"] = {
+            "start": cycles["Start"].round(3).tolist(),
+            "end": cycles["End"].round(3).tolist(),
+            "probability": np.round(cycle_proba, 3).tolist()
         }
-    finally:
-        os.unlink(temp_file.name)
+    return response
+
+def run_analysis_job(payload):
+    """Job worker entry point (runs in a spawned process that imports this module)"""
+    return run_analysis(**payload)
+
+def verify_uid(token):
+    # Verify the Firebase Auth token
+    try:
+        return backend.verify_token(token)
+    except AuthError as e:
+        raise HTTPException(401, detail=str(e))
+
+def too_many_requests(e):
+    return HTTPException(429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def check_rate(uid, cost=1):
+    try:
+        rate_limiter.take(uid, cost)
+    except AdmissionRejected as e:
+        scheduler.reject_rate_limited(uid)
+        logger.info("Rate limited", extra={"tenant": tenant_key(uid), "retry_after": e.retry_after})
+        raise too_many_requests(e)
+
+def check_same_request(job, payload):
+    if job["payload"] != payload:
+        raise HTTPException(422, "Idempotency-Key was already used for a different request")
+
+async def stored_result(job, payload):
+    """Result of an earlier request with the same Idempotency-Key, waiting while it is in flight"""
+    check_same_request(job, payload)
+    deadline = time.monotonic() + IDEMPOTENT_WAIT_S
+    while job["status"] in (QUEUED, RUNNING):
+        if time.monotonic() > deadline:
+            raise HTTPException(409, "A request with this Idempotency-Key is still in progress",
+                                headers={"Retry-After": str(IDEMPOTENT_WAIT_S)})
+        await asyncio.sleep(IDEMPOTENT_POLL_S)
+        job = await run_in_threadpool(jobs.get, job["id"])
+        if job is None:
+            # The first attempt was dropped (rate limited, or its client went away)
+            raise HTTPException(409, "The earlier request with this Idempotency-Key did not complete. Retry it.",
+                                headers={"Retry-After": "1"})
+    if job["status"] == FAILED:
+        raise HTTPException(400, detail=job["error"])
+    return job["result"]
+
+@app.post("/analyze")
+async def analyze_heart_sound(firebase_path: str = Body(..., embed=True), timeline: bool = Body(False, embed=True),
+                              latency_budget_ms: Optional[float] = Body(None, embed=True),
+                              idempotency_key: Optional[str] = Header(None),
+                              token: str = Depends(oauth2_scheme)):
+    uid = verify_uid(token)
+    
+    # The key is reserved before any work, so a retry of a request still
+    # running waits for its result instead of extracting again. Retries
+    # are answered before the rate limit: only new work spends a token.
+    payload = {"firebase_path": firebase_path, "timeline": timeline}
+    reservation = None
+    if idempotency_key:
+        job, created = await run_in_threadpool(jobs.reserve, payload, uid, idempotency_key, SERVER_ID)
+        if not created:
+            return await stored_result(job, payload)
+        reservation = job["id"]
+    try:
+        check_rate(uid)
+    except HTTPException:
+        if reservation:
+            await run_in_threadpool(jobs.discard, reservation)
+        raise
+    
+    # Cheaper pipeline tiers when the queue (or the client's budget) calls for it
+    tier = tier_selector.choose(scheduler.waiting(), scheduler.slots, scheduler.service_s, latency_budget_ms)
+    
+    # Extraction runs off the event loop, in the user's fair share of slots
+    try:
+        async with scheduler.slot(uid):
+            response = await run_in_threadpool(run_analysis, firebase_path, timeline, tier)
+    except AnalysisError as e:
+        if reservation:
+            await run_in_threadpool(jobs.fail, reservation, str(e))
+        raise HTTPException(400, detail=str(e))
+    except AdmissionRejected as e:
+        if reservation:
+            await run_in_threadpool(jobs.discard, reservation)
+        raise too_many_requests(e)
+    except BaseException:
+        # Unexpected error or client gone: a retry runs the request again.
+        # Called directly, since the task may already be cancelled.
+        if reservation:
+            jobs.discard(reservation)
+        raise
+    if reservation:
+        await run_in_threadpool(jobs.complete, reservation, response)
+    return response
+
+def job_status(job):
+    """Client view of a job"""
+    status = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "attempts": job["attempts"]
+    }
+    if job["status"] == DONE:
+        status["result"] = job["result"]
+    elif job["status"] == FAILED:
+        status["error"] = job["error"]
+    return status
+
+@app.post("/jobs", status_code=202)
+async def submit_job(firebase_path: str = Body(..., embed=True), timeline: bool = Body(False, embed=True),
+                     priority: str = Body("interactive", embed=True),
+                     idempotency_key: Optional[str] = Header(None),
+                     token: str = Depends(oauth2_scheme)):
+    """Queue an analysis and return at once; poll GET /jobs/{job_id} for the result"""
+    uid = verify_uid(token)
+    payload = {"firebase_path": firebase_path, "timeline": timeline}
+    # A resubmission gets its job's status without spending a rate-limit token
+    if idempotency_key:
+        job = await run_in_threadpool(jobs.find, uid, idempotency_key)
+        if job is not None:
+            check_same_request(job, payload)
+            return job_status(job)
+    check_rate(uid)
+    if priority not in PRIORITY_LANES:
+        raise HTTPException(400, f"Unknown priority. Use one of {list(PRIORITY_LANES)}")
+    try:
+        validate_path(firebase_path)
+    except AnalysisError as e:
+        raise HTTPException(400, detail=str(e))
+    
+    job, created = await run_in_threadpool(jobs.submit, payload, uid, priority, idempotency_key)
+    if not created:
+        check_same_request(job, payload)
+    return job_status(job)
+
+@app.post("/jobs/batch", status_code=202)
+async def submit_batch(firebase_paths: List[str] = Body(..., embed=True),
+                       priority: str = Body("bulk", embed=True),
+                       idempotency_key: Optional[str] = Header(None),
+                       token: str = Depends(oauth2_scheme)):
+    """Queue one job per recording (bulk lane by default) under a shared batch ID
+    
+    Every new job costs one rate-limit token; batches are capped at
+    MAX_BATCH_JOBS.
+    """
+    uid = verify_uid(token)
+    if priority not in PRIORITY_LANES:
+        raise HTTPException(400, f"Unknown priority. Use one of {list(PRIORITY_LANES)}")
+    if len(firebase_paths) > MAX_BATCH_JOBS:
+        raise HTTPException(413, f"At most {MAX_BATCH_JOBS} recordings per batch. Split it into smaller batches.")
+    try:
+        for firebase_path in firebase_paths:
+            validate_path(firebase_path)
+    except AnalysisError as e:
+        raise HTTPException(400, detail=f"{firebase_path}: {e}")
+    
+    # Per-item keys derived from the batch key make the whole batch idempotent.
+    # A resubmitted batch gets its jobs back; only new items spend tokens.
+    batch_id = new_request_id()
+    keys = [f"{idempotency_key}:{i}" for i in range(len(firebase_paths))] if idempotency_key else None
+    payloads = [{"firebase_path": path} for path in firebase_paths]
+    existing = await run_in_threadpool(jobs.find_many, uid, keys) if keys else [None] * len(firebase_paths)
+    for job, payload in zip(existing, payloads):
+        if job is not None:
+            check_same_request(job, payload)
+    n_new = sum(job is None for job in existing)
+    if n_new == 0:
+        submitted = existing
+    else:
+        check_rate(uid, n_new)
+        submitted = []
+        # Items submitted concurrently under the same keys are checked too
+        for (job, created), payload in zip(await run_in_threadpool(
+                jobs.submit_many, payloads, uid, priority, keys, batch_id), payloads):
+            if not created:
+                check_same_request(job, payload)
+            submitted.append(job)
+    return {
+        "batch_id": submitted[0]["batch_id"] if submitted else batch_id,
+        "jobs": [job_status(job) for job in submitted]
+    }
+
+@app.get("/jobs/batch/{batch_id}")
+async def get_batch(batch_id: str, token: str = Depends(oauth2_scheme)):
+    uid = verify_uid(token)
+    batch = [job for job in await run_in_threadpool(jobs.get_batch, batch_id) if job["owner"] == uid]
+    if not batch:
+        raise HTTPException(404, "Batch not found")
+    counts = {}
+    for job in batch:
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    return {"batch_id": batch_id, "counts": counts, "jobs": [job_status(job) for job in batch]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, token: str = Depends(oauth2_scheme)):
+    uid = verify_uid(token)
+    job = await run_in_threadpool(jobs.get, job_id)
+    # Other users' jobs are reported as missing
+    if job is None or job["owner"] != uid:
+        raise HTTPException(404, "Job not found")
+    return job_status(job)
 
 def generate_clinical_suggestions(prediction, features):
     # Add domain-specific logic here
@@ -0,0 +1,217 @@
+import argparse
+import contextlib
+import glob
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# HEART_MEMORY_PROFILE=1 turns profiling on at import; otherwise stage() is a
+# shared no-op context and costs one attribute check per stage
+PROFILE_ENABLED = os.environ.get("HEART_MEMORY_PROFILE") == "1"
+# Interval of the background RSS sampler (seconds)
+RSS_SAMPLE_S = 0.005
+# Relative growth of a stage's peak over the baseline that counts as a regression
+REGRESSION_TOLERANCE = 0.2
+# Stages whose baseline peak is below this are too small to compare (MB)
+MIN_COMPARED_MB = 5.0
+
+def current_rss():
+    """Resident set size of this process in bytes, or None off Linux"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class MemoryProfiler:
+    """Attribute traced allocations and RSS to named pipeline stages
+
+    Each stage records, relative to the memory in use when it was entered:
+    the peak of traced (Python and numpy) allocations, the allocations it
+    left behind, and the peak RSS seen by a background sampler, which also
+    covers native buffers tracemalloc cannot see (FFTW/BLAS workspaces).
+    Stages nest; an inner stage's peak counts towards its outer stages.
+    tracemalloc is process-wide, so profile one extraction at a time.
+    """
+
+    def __init__(self, sample_s=RSS_SAMPLE_S):
+        self.sample_s = sample_s
+        self.active = False
+        self.records = []
+        self._stack = []
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def enable(self):
+        if self.active:
+            return
+        tracemalloc.start()
+        self.active = True
+        if current_rss() is not None:
+            self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+            self._sampler.start()
+
+    def disable(self):
+        if not self.active:
+            return
+        self.active = False
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        tracemalloc.stop()
+
+    def _sample_rss(self):
+        while self.active:
+            rss = current_rss()
+            with self._lock:
+                for frame in self._stack:
+                    frame["rss_peak"] = max(frame["rss_peak"], rss)
+            time.sleep(self.sample_s)
+
+    def stage(self, name):
+        """Context manager attributing the block's memory to name"""
+        if not self.active:
+            return contextlib.nullcontext()
+        return self._stage(name)
+
+    @contextlib.contextmanager
+    def _stage(self, name):
+        current, peak = tracemalloc.get_traced_memory()
+        rss = current_rss() or 0
+        with self._lock:
+            # reset_peak() below would hide the outer stages' peak so far
+            for frame in self._stack:
+                frame["peak"] = max(frame["peak"], peak)
+            path = "/".join([frame["name"] for frame in self._stack] + [name])
+            frame = {"name": name, "start": current, "peak": current, "rss_start": rss, "rss_peak": rss}
+            self._stack.append(frame)
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            rss = current_rss() or 0
+            with self._lock:
+                self._stack.pop()
+                frame["peak"] = max(frame["peak"], peak)
+                frame["rss_peak"] = max(frame["rss_peak"], rss)
+                for outer in self._stack:
+                    outer["peak"] = max(outer["peak"], frame["peak"])
+                    outer["rss_peak"] = max(outer["rss_peak"], frame["rss_peak"])
+            self.records.append({
+                "Stage": path,
+                "Peak_MB": (frame["peak"] - frame["start"]) / 2**20,
+                "Retained_MB": (current - frame["start"]) / 2**20,
+                "RSS_Peak_MB": (frame["rss_peak"] - frame["rss_start"]) / 2**20
+            })
+
+    def collect(self):
+        """Records since the last collect(), one per stage call"""
+        records, self.records = self.records, []
+        return records
+
+profiler = MemoryProfiler()
+stage = profiler.stage
+if PROFILE_ENABLED:
+    profiler.enable()
+
+def profile_recording(file_path, **kwargs):
+    """Per-stage memory of one extract_features call on file_path
+
+    Repeated calls of a stage (one per window in the chunked mode) are
+    summed into Cumulative_MB; Peak_MB is the largest single call.
+    """
+    from extract_features import extract_features, audio_duration
+
+    profiler.collect()
+    with stage("extract"):
+        features, _ = extract_features(file_path, **kwargs)
+    calls = pd.DataFrame(profiler.collect())
+    report = calls.groupby("Stage", sort=False).agg(
+        Calls=("Peak_MB", "size"),
+        Peak_MB=("Peak_MB", "max"),
+        Cumulative_MB=("Peak_MB", "sum"),
+        Retained_MB=("Retained_MB", "sum"),
+        RSS_Peak_MB=("RSS_Peak_MB", "max")
+    ).reset_index()
+    duration = audio_duration(file_path)
+    report.insert(0, "File", os.path.basename(file_path))
+    report.insert(1, "Duration_s", duration)
+    report["Peak_MB_per_min"] = report["Peak_MB"] / (duration / 60)
+    report["Error"] = features.get("error")
+    return report
+
+def summarize(report):
+    """Per-stage worst peak and growth with recording duration
+
+    MB_per_min is the least-squares slope of peak against duration across
+    recordings (NaN with fewer than two distinct durations); the chunked
+    mode should keep it near zero.
+    """
+    rows = []
+    for name, group in report.groupby("Stage", sort=False):
+        minutes = group["Duration_s"].to_numpy() / 60
+        slope = np.polyfit(minutes, group["Peak_MB"], 1)[0] if np.ptp(minutes) > 0 else np.nan
+        rows.append({
+            "Stage": name,
+            "Max_Peak_MB": group["Peak_MB"].max(),
+            "Mean_Cumulative_MB": group["Cumulative_MB"].mean(),
+            "Max_RSS_Peak_MB": group["RSS_Peak_MB"].max(),
+            "MB_per_min": slope
+        })
+    return pd.DataFrame(rows).sort_values("Max_Peak_MB", ascending=False)
+
+def find_regressions(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """(file, stage) rows whose peak grew more than tolerance over the baseline report"""
+    merged = report.merge(baseline[["File", "Stage", "Peak_MB"]], on=["File", "Stage"], suffixes=("", "_Baseline"))
+    merged = merged[merged["Peak_MB_Baseline"] >= MIN_COMPARED_MB]
+    merged["Growth"] = merged["Peak_MB"] / merged["Peak_MB_Baseline"] - 1
+    return merged[merged["Growth"] > tolerance][["File", "Stage", "Peak_MB_Baseline", "Peak_MB", "Growth"]]
+
+if __name__ == "__main__":
+    # extract_features records into the imported module's profiler, not this __main__ copy's
+    from memory_profile import profiler, profile_recording, summarize, find_regressions
+    from extract_features import extract_features, load_model_metadata, AUDIO_EXTENSIONS, PIPELINE_TIERS
+
+    parser = argparse.ArgumentParser(description="Per-stage memory profile of feature extraction")
+    parser.add_argument("recordings_dir", nargs="?", default="test_recordings")
+    parser.add_argument("--tier", choices=PIPELINE_TIERS, default="full")
+    parser.add_argument("--chunked", action="store_true", help="Force the windowed mode for every recording")
+    parser.add_argument("--save", help="Write the per-recording report to this CSV")
+    parser.add_argument("--baseline", help="CSV from an earlier --save; exit 1 if a stage's peak grew")
+    args = parser.parse_args()
+
+    files = sorted(f for f in glob.glob(os.path.join(args.recordings_dir, "*"))
+                   if f.lower().endswith(AUDIO_EXTENSIONS))
+    sr = load_model_metadata()["analysis_sr"]
+
+    profiler.enable()
+    # Warm-up run, so the DSP plans cached on first use do not count towards the first file
+    if files:
+        extract_features(files[0], sr=sr, tier=args.tier)
+    report = pd.concat([profile_recording(f, sr=sr, tier=args.tier, chunked=args.chunked or None)
+                        for f in files], ignore_index=True)
+    profiler.disable()
+
+    pd.set_option("display.width", 200)
+    fmt = lambda v: f"{v:.3g}"
+    print("\n=== Memory per stage and recording ===")
+    print(report.drop(columns="Error").to_string(index=False, float_format=fmt))
+    print("\n=== Stages by peak allocation ===")
+    print(summarize(report).to_string(index=False, float_format=fmt))
+    for row in report.dropna(subset=["Error"]).drop_duplicates("File").itertuples():
+        print(f"{row.File}: {row.Error}")
+
+    if args.save:
+        report.to_csv(args.save, index=False)
+    if args.baseline:
+        regressions = find_regressions(report, pd.read_csv(args.baseline))
+        if len(regressions):
+            print(f"\n=== Peak memory regressions (>{REGRESSION_TOLERANCE:.0%}) ===")
+            print(regressions.to_string(index=False, float_format=fmt))
+            sys.exit(1)
+        print("\nNo peak memory regressions against the baseline.")
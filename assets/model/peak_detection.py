@@ -0,0 +1,127 @@
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+
+# Peak labels, matching the S1/S2 classes of the segmentation files
+S1 = 1
+S2 = 2
+
+# Gaps closer than this (relative) are too similar to tell systole from diastole
+INTERVAL_TOLERANCE = 0.1
+
+def _sliding_max(x, pre, post):
+    """max(x[n - pre:n + post]) for every n, truncated at the edges"""
+    size = pre + post
+    return maximum_filter1d(x, size=size, origin=pre - size // 2, mode='constant', cval=-np.inf)
+
+def _sliding_mean(x, pre, post):
+    """mean(x[n - pre:n + post]) for every n, truncated at the edges"""
+    n = np.arange(len(x))
+    lo = np.maximum(n - pre, 0)
+    hi = np.minimum(n + post, len(x))
+    csum = np.concatenate(([0.0], np.cumsum(x, dtype=np.float64)))
+    return (csum[hi] - csum[lo]) / (hi - lo)
+
+def _candidates(x, pre_max, post_max, pre_avg, post_avg, delta):
+    """Frames that are the local max and at least delta above the local mean"""
+    is_max = x == _sliding_max(x, pre_max, post_max)
+    return np.flatnonzero(is_max & (x >= _sliding_mean(x, pre_avg, post_avg) + delta))
+
+def _apply_wait(candidates, wait, last_peak=-np.inf):
+    """Greedily keep candidates more than wait frames after the previous peak"""
+    if len(candidates) == 0 or np.all(np.diff(candidates) > wait) and candidates[0] > last_peak + wait:
+        return candidates
+    peaks = []
+    for c in candidates:
+        if c > last_peak + wait:
+            peaks.append(c)
+            last_peak = c
+    return np.array(peaks, dtype=candidates.dtype)
+
+def pick_peaks(x, pre_max, post_max, pre_avg, post_avg, delta, wait):
+    """O(n) peak picker with the semantics of librosa.util.peak_pick
+
+    A frame n is a peak if x[n] == max(x[n - pre_max:n + post_max]),
+    x[n] >= mean(x[n - pre_avg:n + post_avg]) + delta and it comes more
+    than wait frames after the previous peak. Sliding max and mean are
+    computed for all frames at once; only the surviving candidates are
+    visited to apply the wait rule.
+    """
+    x = np.asarray(x)
+    if len(x) == 0:
+        return np.array([], dtype=int)
+    return _apply_wait(_candidates(x, pre_max, post_max, pre_avg, post_avg, delta), wait)
+
+class StreamingPeakPicker:
+    """Chunk-by-chunk version of pick_peaks with identical output
+
+    push() returns the absolute indices of peaks that are final, i.e. whose
+    right-hand windows are complete. The last look-ahead frames are
+    decided by flush() at the end of the stream.
+    """
+
+    def __init__(self, pre_max, post_max, pre_avg, post_avg, delta, wait):
+        self.params = (pre_max, post_max, pre_avg, post_avg, delta)
+        self.wait = wait
+        self.history = max(pre_max, pre_avg)
+        self.lookahead = max(post_max, post_avg)
+        self._buffer = np.empty(0)
+        self._offset = 0        # Absolute index of _buffer[0]
+        self._next = 0          # First absolute frame not decided yet
+        self._last_peak = -np.inf
+
+    def push(self, chunk):
+        self._buffer = np.concatenate((self._buffer, np.asarray(chunk, dtype=np.float64)))
+        return self._decide(len(self._buffer) - self.lookahead)
+
+    def flush(self):
+        return self._decide(len(self._buffer))
+
+    def _decide(self, end):
+        start = self._next - self._offset
+        if end <= start:
+            return np.array([], dtype=int)
+
+        # The buffer holds enough history before start and look-ahead after
+        # end, so windows are only truncated at the true stream edges
+        candidates = _candidates(self._buffer, *self.params)
+        candidates = candidates[(candidates >= start) & (candidates < end)] + self._offset
+        peaks = _apply_wait(candidates, self.wait, self._last_peak)
+        if len(peaks):
+            self._last_peak = peaks[-1]
+
+        self._next = self._offset + end
+        keep_from = max(0, end - self.history)
+        self._buffer = self._buffer[keep_from:]
+        self._offset += keep_from
+        return peaks
+
+def label_heart_sounds(peak_times, amplitudes=None):
+    """Label detected peaks as S1 or S2 with vectorized interval and amplitude rules
+
+    Systole (S1 to S2) is shorter than diastole (S2 to S1), so a peak whose
+    following gap is shorter than its preceding gap is an S1. Where the two
+    gaps are too similar (fast heart rates), the louder of a peak and its
+    neighbours is taken as S1. The first and last peaks alternate with
+    their only neighbour.
+    """
+    peak_times = np.asarray(peak_times, dtype=float)
+    n = len(peak_times)
+    if n < 2:
+        return np.full(n, S1)
+
+    gaps = np.diff(peak_times)
+    prev_gap = np.concatenate(([np.nan], gaps))
+    next_gap = np.concatenate((gaps, [np.nan]))
+    labels = np.where(next_gap < prev_gap, S1, S2)
+
+    if amplitudes is not None and n > 2:
+        amplitudes = np.asarray(amplitudes, dtype=float)
+        ambiguous = np.abs(next_gap - prev_gap) < INTERVAL_TOLERANCE * np.fmin(next_gap, prev_gap)
+        neighbours = 0.5 * (np.concatenate(([amplitudes[1]], amplitudes[:-1])) +
+                            np.concatenate((amplitudes[1:], [amplitudes[-2]])))
+        labels = np.where(ambiguous, np.where(amplitudes >= neighbours, S1, S2), labels)
+
+    # Edge peaks have a single gap: alternate with the neighbour
+    labels[0] = S1 + S2 - labels[1]
+    labels[-1] = S1 + S2 - labels[-2]
+    return labels
@@ -0,0 +1,74 @@
+import glob
+import os
+import sys
+import time
+import tracemalloc
+import joblib
+import numpy as np
+import pandas as pd
+from extract_features import extract_features, load_model_metadata
+from predict_heart_murmur import MODEL_PATH, FEATURE_NAMES_PATH
+
+def run_extraction(file_path, precision, sr):
+    """Extract features and record wall time and peak traced allocation"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    features, _ = extract_features(file_path, sr=sr, precision=precision)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return features, elapsed, peak
+
+def precision_report(files, model=None, feature_names=None, sr=None):
+    """Compare float64 and float32 extraction on each file
+
+    Reports the largest relative feature difference, speed and peak memory
+    for both precisions and, when a model is given, whether the predicted
+    class and probability agree.
+    """
+    rows = []
+    for file_path in files:
+        f64, t64, m64 = run_extraction(file_path, "float64", sr)
+        f32, t32, m32 = run_extraction(file_path, "float32", sr)
+        if "error" in f64 or "error" in f32:
+            rows.append({"File": os.path.basename(file_path), "Error": f64.get("error") or f32.get("error")})
+            continue
+
+        keys = sorted(set(f64) & set(f32))
+        a = np.array([f64[k] for k in keys])
+        b = np.array([f32[k] for k in keys])
+        rel = np.abs(a - b) / np.maximum(np.abs(a), 1e-12)
+        row = {
+            "File": os.path.basename(file_path),
+            "MaxRelDiff": float(rel.max()),
+            "WorstFeature": keys[int(rel.argmax())],
+            "Time64_s": t64,
+            "Time32_s": t32,
+            "PeakMem64_MB": m64 / 2**20,
+            "PeakMem32_MB": m32 / 2**20
+        }
+
+        if model is not None:
+            X = pd.DataFrame([f64, f32]).reindex(columns=feature_names).fillna(0)
+            p64, p32 = model.predict_proba(X)[:, 1]
+            row.update({
+                "Proba64": float(p64),
+                "Proba32": float(p32),
+                "SameDecision": bool((p64 > 0.5) == (p32 > 0.5))
+            })
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    recordings_dir = sys.argv[1] if len(sys.argv) > 1 else "test_recordings"
+    files = sorted(glob.glob(os.path.join(recordings_dir, "*.wav")))
+
+    model = feature_names = None
+    if os.path.exists(MODEL_PATH):
+        model = joblib.load(MODEL_PATH)
+        feature_names = joblib.load(FEATURE_NAMES_PATH)
+
+    report = precision_report(files, model, feature_names, sr=load_model_metadata()["analysis_sr"])
+    pd.set_option("display.width", 200)
+    print("\n=== float32 vs float64 extraction ===")
+    print(report.to_string(index=False, float_format=lambda v: f"{v:.3g}"))
@@ -1,36 +1,64 @@
 import joblib
-import librosa
-import numpy as np
 import pandas as pd
 import sys
 import os
-from extract_features import extract_features
+import glob
+import csv
+import json
+import time
+import argparse
+import multiprocessing
+from extract_features import extract_features, aggregate_valve_features, load_model_metadata, VALVE_PREFIXES, AUDIO_EXTENSIONS
+from structured_logging import setup_logging, correlation
 
-# Load model and feature names
-model = joblib.load('heart_sound_model.joblib')
-feature_names = joblib.load('feature_names.joblib')
+MODEL_PATH = 'heart_sound_model.joblib'
+FEATURE_NAMES_PATH = 'feature_names.joblib'
+# Feature-budgeted variant written by train_model_heart.py --compress
+COMPACT_MODEL_PATH = 'heart_sound_model_compact.joblib'
+COMPACT_FEATURE_NAMES_PATH = 'feature_names_compact.joblib'
+BATCH_FIELDS = ["file", "valve", "prediction", "confidence", "error"]
+
+# Model, feature names and analysis rate are loaded lazily (once per process)
+model = None
+feature_names = None
+analysis_sr = None
+
+def load_model(model_path=MODEL_PATH, names_path=FEATURE_NAMES_PATH):
+    """Load model and feature names into this process if not already loaded"""
+    global model, feature_names, analysis_sr
+    if model is None:
+        model = joblib.load(model_path)
+        feature_names = joblib.load(names_path)
+        analysis_sr = load_model_metadata()["analysis_sr"]
+
+def parse_valve(file_path):
+    """Extract valve from filename (e.g., "9983_AV.wav" -> "AV")"""
+    filename = os.path.basename(file_path)
+    return filename.split("_")[-1].split(".")[0].upper()
+
+def is_patient_level_model(names):
+    """Patient-level models are trained on valve-prefixed features (e.g. "MV_HeartRate")"""
+    return any(name.split("_", 1)[0] in VALVE_PREFIXES for name in names)
 
 def predict_single_recording(file_path):
     try:
-        # Extract valve from filename (e.g., "9983_AV.wav" -> "AV")
-        filename = os.path.basename(file_path)
-        valve = filename.split("_")[-1].split(".")[0].upper()
-        
+        load_model()
+        valve = parse_valve(file_path)
+
         # Validate valve
-        VALVE_PREFIXES = ["AV", "MV", "PV", "TV"]
         if valve not in VALVE_PREFIXES:
             return {"error": f"Invalid valve '{valve}' in filename. Use format: [ID]_[Valve].wav"}
-        
+
         # Extract features
-        features = extract_features(file_path)
+        features, _ = extract_features(file_path, sr=analysis_sr, feature_names=feature_names)
         if "error" in features:
             return {"error": features["error"]}
-        
+
         # Rest of the code remains unchanged
         X = pd.DataFrame([features]).reindex(columns=feature_names).fillna(0)
         prediction = model.predict(X)[0]
         proba = model.predict_proba(X)[0][1]
-        
+
         return {
             "prediction": "Abnormal" if prediction == 1 else "Normal",
             "confidence": float(proba),
@@ -40,17 +68,191 @@ def predict_single_recording(file_path):
     except Exception as e:
         return {"error": str(e)}
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:  # Changed from 3 to 2
-        print("Usage: python predict_heart_murmur.py <path/to/audio.wav>")
-        print("Filename must contain valve (e.g., 9983_AV.wav)")
-        sys.exit(1)
+def predict_patient(file_paths, n_jobs=-1):
+    """Score all of a patient's AV/MV/PV/TV recordings as a single decision
+
+    Features for every recording are extracted in parallel. A patient-level
+    model gets one per-valve aggregated vector. A per-recording model scores
+    all recordings in one predict_proba call, and the patient is abnormal if
+    any valve is (a murmur only needs to be audible at one site).
+    """
+    try:
+        load_model()
+        valves = [parse_valve(p) for p in file_paths]
+        invalid = [p for p, v in zip(file_paths, valves) if v not in VALVE_PREFIXES]
+        if invalid:
+            return {"error": f"Invalid valve in filename(s) {invalid}. Use format: [ID]_[Valve].wav"}
+
+        results = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(extract_features)(p, sr=analysis_sr, feature_names=feature_names) for p in file_paths
+        )
+
+        valve_features = {}
+        errors = {}
+        for file_path, valve, (features, _) in zip(file_paths, valves, results):
+            if "error" in features:
+                errors[file_path] = features["error"]
+            else:
+                valve_features.setdefault(valve, []).append(features)
+
+        if not valve_features:
+            return {"error": "No recording could be analyzed", "recording_errors": errors}
+
+        if is_patient_level_model(feature_names):
+            X = pd.DataFrame([aggregate_valve_features(valve_features)]).reindex(columns=feature_names).fillna(0)
+            proba = float(model.predict_proba(X)[0][1])
+            valve_confidence = {}
+        else:
+            rows = [(valve, f) for valve, dicts in valve_features.items() for f in dicts]
+            X = pd.DataFrame([f for _, f in rows]).reindex(columns=feature_names).fillna(0)
+            probas = model.predict_proba(X)[:, 1]
+            valve_confidence = {}
+            for (valve, _), p in zip(rows, probas):
+                valve_confidence[valve] = max(valve_confidence.get(valve, 0.0), float(p))
+            proba = max(valve_confidence.values())
+
+        return {
+            "prediction": "Abnormal" if proba > 0.5 else "Normal",
+            "confidence": proba,
+            "valves": sorted(valve_features.keys()),
+            "valve_confidence": valve_confidence,
+            "recording_errors": errors
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+def expand_inputs(inputs):
+    """Resolve files, directories (searched recursively) and glob patterns to audio files"""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, names in os.walk(item):
+                files.extend(os.path.join(root, n) for n in names if n.lower().endswith(AUDIO_EXTENSIONS))
+        elif glob.has_magic(item):
+            files.extend(p for p in glob.glob(item, recursive=True) if p.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            files.append(item)
+    # De-duplicate while keeping a stable order
+    return sorted(set(os.path.normpath(f) for f in files))
+
+def load_scored_files(output_path, fmt):
+    """Files already present in a previous (possibly interrupted) batch output"""
+    if not os.path.exists(output_path):
+        return set()
+    scored = set()
+    with open(output_path, newline="") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                if row.get("file"):
+                    scored.add(row["file"])
+        else:
+            for line in f:
+                try:
+                    scored.add(json.loads(line)["file"])
+                except (ValueError, KeyError):
+                    # Truncated last line from an interrupted run
+                    continue
+    return scored
+
+def init_worker(model_path=MODEL_PATH, names_path=FEATURE_NAMES_PATH):
+    """Pool initializer: per-process log writer, then the model"""
+    setup_logging()
+    load_model(model_path, names_path)
+
+def score_file(file_path):
+    """Worker task for batch mode (log records carry the file name as request ID)"""
+    with correlation(os.path.basename(file_path)):
+        result = predict_single_recording(file_path)
+    return {
+        "file": file_path,
+        "valve": result.get("valve"),
+        "prediction": result.get("prediction"),
+        "confidence": result.get("confidence"),
+        "error": result.get("error")
+    }
+
+def run_batch(inputs, output_path, fmt="jsonl", workers=None, chunksize=4,
+              model_path=MODEL_PATH, names_path=FEATURE_NAMES_PATH):
+    """Score every recording under inputs, streaming one result per line to output_path
     
-    result = predict_single_recording(sys.argv[1])
+    Files already in output_path are skipped, so an interrupted run can be
+    restarted with the same command. Each worker loads the model once.
+    """
+    files = expand_inputs(inputs)
+    scored = load_scored_files(output_path, fmt)
+    todo = [f for f in files if f not in scored]
+    print(f"Found {len(files)} recordings, {len(files) - len(todo)} already scored, {len(todo)} to process",
+          file=sys.stderr)
+    if not todo:
+        return
+
+    write_header = fmt == "csv" and not os.path.exists(output_path)
+    n_done = 0
+    n_errors = 0
+    start = time.perf_counter()
+    with open(output_path, "a", newline="") as out, \
+            multiprocessing.Pool(workers, initializer=init_worker, initargs=(model_path, names_path)) as pool:
+        writer = csv.DictWriter(out, fieldnames=BATCH_FIELDS) if fmt == "csv" else None
+        if write_header:
+            writer.writeheader()
+
+        for row in pool.imap_unordered(score_file, todo, chunksize=chunksize):
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                out.write(json.dumps(row) + "\n")
+            out.flush()
+
+            n_done += 1
+            n_errors += row["error"] is not None
+            if n_done % 100 == 0 or n_done == len(todo):
+                elapsed = time.perf_counter() - start
+                print(f"{n_done}/{len(todo)} scored ({n_errors} errors), "
+                      f"{n_done / elapsed:.2f} recordings/s", file=sys.stderr)
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(
+        description="Predict heart murmurs. Filenames must contain the valve (e.g., 9983_AV.wav)"
+    )
+    parser.add_argument("paths", nargs="+",
+                        help="One recording, several recordings of the same patient, "
+                             "or (with --batch) files, directories and glob patterns")
+    parser.add_argument("--batch", action="store_true", help="Score every recording independently")
+    parser.add_argument("--output", default="predictions.jsonl", help="Batch output file (appended to)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Use the compressed model (fewer features, faster extraction and scoring)")
+    args = parser.parse_args()
+    model_paths = (COMPACT_MODEL_PATH, COMPACT_FEATURE_NAMES_PATH) if args.compact else (MODEL_PATH, FEATURE_NAMES_PATH)
+
+    if args.batch:
+        run_batch(args.paths, args.output, args.format, args.workers, model_path=model_paths[0],
+                  names_path=model_paths[1])
+        sys.exit(0)
+
+    load_model(*model_paths)
+
+    if len(args.paths) > 1:
+        result = predict_patient(args.paths)
+        print("\n=== Patient Prediction Result ===")
+        print(f"Valves: {result.get('valves', [])}")
+        print(f"Prediction: {result.get('prediction', 'Error')}")
+        print(f"Confidence: {result.get('confidence', 0):.2f}")
+        for valve, confidence in result.get("valve_confidence", {}).items():
+            print(f"  {valve}: {confidence:.2f}")
+        for file_path, error in result.get("recording_errors", {}).items():
+            print(f"Skipped {file_path}: {error}")
+        if "error" in result:
+            print(f"\nError: {result['error']}")
+        sys.exit(0)
+
+    result = predict_single_recording(args.paths[0])
     print("\n=== Prediction Result ===")
     print(f"Valve: {result.get('valve', 'Unknown')}")
     print(f"Prediction: {result.get('prediction', 'Error')}")
     print(f"Confidence: {result.get('confidence', 0):.2f}")
     print(f"Features Used: {result.get('features_used', [])}")
     if "error" in result:
-        print(f"\nError: {result['error']}")
\ No newline at end of file
+        print(f"\nError: {result['error']}")
@@ -0,0 +1,105 @@
+import numpy as np
+
+# Successive cycle-length differences above this count towards pNN50 (seconds)
+NN50_S = 0.05
+
+# Rhythm features in output order; Systole/Diastole/HeartRate keep the
+# definitions of the original timing features
+RHYTHM_FEATURES = [
+    "HeartRate",
+    "Systole_Mean", "Systole_Std",
+    "Diastole_Mean", "Diastole_Std",
+    "Cycle_Std",
+    "SystoleDiastole_Ratio",
+    "HRV_RMSSD", "HRV_pNN50",
+    "Alternation_Score"
+]
+
+def _group_mean(values, groups, n_groups):
+    """Per-group mean (NaN for empty groups)"""
+    counts = np.bincount(groups, minlength=n_groups)
+    sums = np.bincount(groups, weights=values, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+def _group_std(values, groups, n_groups):
+    """Per-group population standard deviation (NaN for empty groups)"""
+    mean = _group_mean(values, groups, n_groups)
+    return np.sqrt(_group_mean((values - mean[groups]) ** 2, groups, n_groups))
+
+def rhythm_features_batch(peak_time_lists):
+    """Rhythm features of many recordings in one vectorized pass
+
+    peak_time_lists holds one array of alternating S1/S2 peak times
+    (seconds) per recording. Intervals alternate systole (even) and
+    diastole (odd); a cycle is a systole plus the following diastole.
+
+    - HeartRate: 60 / mean cycle length (from the raw intervals if there is
+      no complete cycle)
+    - Systole_/Diastole_Mean/Std, Cycle_Std: interval statistics
+    - SystoleDiastole_Ratio: mean systole / diastole per cycle
+    - HRV_RMSSD, HRV_pNN50: root mean square of successive cycle-length
+      differences, and the fraction of them above NN50_S
+    - Alternation_Score: share of cycles whose short/long order matches the
+      majority (1.0 when S1/S2 alternate consistently, 0.5 at random)
+
+    Returns {feature: array of one value per recording}, NaN where a
+    recording has too few peaks for that feature.
+    """
+    n = len(peak_time_lists)
+    lengths = np.array([len(times) for times in peak_time_lists], dtype=int)
+    times = np.concatenate([np.asarray(t, dtype=float) for t in peak_time_lists]) if n else np.empty(0)
+    recording = np.repeat(np.arange(n), lengths)
+
+    # Intervals between consecutive peaks of the same recording
+    same = recording[1:] == recording[:-1]
+    intervals = np.diff(times)[same]
+    rec = recording[:-1][same]
+    first = np.concatenate(([0], np.cumsum(np.maximum(lengths - 1, 0))[:-1]))
+    position = np.arange(len(intervals)) - first[rec]
+    n_intervals = np.bincount(rec, minlength=n)
+
+    # One interval alone is not split into systole and diastole
+    split = n_intervals[rec] > 1
+    systole = split & (position % 2 == 0)
+    diastole = split & (position % 2 == 1)
+
+    # Cycles: each systole with the diastole right after it
+    pair = np.flatnonzero(systole[:-1] & diastole[1:] & (rec[:-1] == rec[1:])) if len(intervals) else np.empty(0, int)
+    cycles = intervals[pair] + intervals[pair + 1]
+    cycle_rec = rec[pair]
+    n_cycles = np.bincount(cycle_rec, minlength=n)
+
+    mean_cycle = _group_mean(cycles, cycle_rec, n)
+    heart_rate = np.where(n_cycles > 0, 60 / mean_cycle, 60 / _group_mean(intervals, rec, n) / 2)
+
+    # Successive cycle differences within a recording
+    same_cycle = cycle_rec[1:] == cycle_rec[:-1]
+    cycle_diff = np.diff(cycles)[same_cycle]
+    diff_rec = cycle_rec[:-1][same_cycle]
+
+    shorter_first = (intervals[pair] < intervals[pair + 1]).astype(float)
+    share = _group_mean(shorter_first, cycle_rec, n)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        features = {
+            "HeartRate": heart_rate,
+            "Systole_Mean": _group_mean(intervals[systole], rec[systole], n),
+            "Systole_Std": _group_std(intervals[systole], rec[systole], n),
+            "Diastole_Mean": _group_mean(intervals[diastole], rec[diastole], n),
+            "Diastole_Std": _group_std(intervals[diastole], rec[diastole], n),
+            "Cycle_Std": _group_std(cycles, cycle_rec, n),
+            "SystoleDiastole_Ratio": _group_mean(intervals[pair] / intervals[pair + 1], cycle_rec, n),
+            "HRV_RMSSD": np.sqrt(_group_mean(cycle_diff ** 2, diff_rec, n)),
+            "HRV_pNN50": _group_mean((np.abs(cycle_diff) > NN50_S).astype(float), diff_rec, n),
+            "Alternation_Score": np.maximum(share, 1 - share)
+        }
+    # Fewer than two peaks: no rhythm at all
+    for values in features.values():
+        values[lengths < 2] = np.nan
+    return features
+
+def rhythm_features(peak_times):
+    """rhythm_features_batch for one recording, as a dict without the undefined features"""
+    batch = rhythm_features_batch([peak_times])
+    return {name: float(batch[name][0]) for name in RHYTHM_FEATURES if not np.isnan(batch[name][0])}
@@ -0,0 +1,80 @@
+import numpy as np
+
+# Raw samples from librosa are floats in [-1, 1]
+CLIP_LEVEL = 0.99
+MAX_CLIPPED_RATIO = 0.01      # More than 1% of samples at full scale
+MIN_RMS = 1e-4                # Silence / disconnected stethoscope
+MIN_DURATION_S = 2.0          # At least two cardiac cycles
+HEART_BAND_HZ = (20, 400)
+MIN_BAND_SNR_DB = -10.0       # Heart band holds under 10% of the power
+MIN_PERIODICITY = 0.1         # Envelope autocorrelation peak at a heart-rate lag
+HEART_RATE_BPM = (40, 220)
+ENVELOPE_RATE = 100           # Hz, envelope resolution for the periodicity check
+
+def _periodicity(band_signal, sr):
+    """Peak normalized autocorrelation of the band envelope within the heart-rate lag range"""
+    block = max(1, int(sr // ENVELOPE_RATE))
+    n_blocks = len(band_signal) // block
+    envelope = np.abs(band_signal[:n_blocks * block]).reshape(n_blocks, block).mean(axis=1)
+    envelope = envelope - envelope.mean()
+
+    # Autocorrelation through the FFT (zero-padded to avoid wrap-around)
+    spectrum = np.fft.rfft(envelope, n=2 * n_blocks)
+    acf = np.fft.irfft(np.abs(spectrum)**2)[:n_blocks]
+    if acf[0] <= 0:
+        return 0.0
+    acf /= acf[0]
+
+    env_rate = sr / block
+    min_lag = int(env_rate * 60 / HEART_RATE_BPM[1])
+    max_lag = min(int(env_rate * 60 / HEART_RATE_BPM[0]), n_blocks - 1)
+    if max_lag <= min_lag:
+        return 0.0
+    return float(np.max(acf[min_lag:max_lag + 1]))
+
+def assess_signal_quality(y, sr):
+    """Cheap quality index computed on the raw samples before any heavy DSP
+
+    Returns a dict with the clipping ratio, RMS, heart-band SNR (dB) and
+    periodicity, plus "ok" and, for unusable recordings, an actionable "reason".
+    """
+    duration = len(y) / sr
+    quality = {"Duration": float(duration)}
+    if duration < MIN_DURATION_S:
+        quality.update(ok=False, reason=(
+            f"Recording is too short ({duration:.1f}s). Record at least {MIN_DURATION_S:.0f} seconds."
+        ))
+        return quality
+
+    quality["ClippedRatio"] = float(np.mean(np.abs(y) >= CLIP_LEVEL))
+    quality["RMS"] = float(np.sqrt(np.mean(np.square(y, dtype=np.float64))))
+
+    # One FFT gives both the band SNR and the band-limited signal
+    spectrum = np.fft.rfft(y - np.mean(y))
+    freqs = np.fft.rfftfreq(len(y), d=1.0 / sr)
+    power = np.abs(spectrum)**2
+    in_band = (freqs >= HEART_BAND_HZ[0]) & (freqs <= HEART_BAND_HZ[1])
+    band_power = power[in_band].sum()
+    other_power = power[~in_band].sum()
+    quality["BandSNR_dB"] = float(10 * np.log10((band_power + 1e-12) / (other_power + 1e-12)))
+
+    spectrum[~in_band] = 0
+    quality["Periodicity"] = _periodicity(np.fft.irfft(spectrum, n=len(y)), sr)
+
+    if quality["RMS"] < MIN_RMS:
+        reason = "Recording is silent. Check that the stethoscope is connected and the microphone is not muted."
+    elif quality["ClippedRatio"] > MAX_CLIPPED_RATIO:
+        reason = (f"{quality['ClippedRatio']:.1%} of samples are clipped. "
+                  "Lower the microphone gain or apply less pressure with the stethoscope.")
+    elif quality["BandSNR_dB"] < MIN_BAND_SNR_DB:
+        reason = (f"Too little heart sound energy (SNR {quality['BandSNR_dB']:.1f} dB in the 20-400 Hz band). "
+                  "Reposition the stethoscope over a valve area and reduce background noise.")
+    elif quality["Periodicity"] < MIN_PERIODICITY:
+        reason = "No regular heartbeat rhythm found. Hold the stethoscope still over a valve area and record again."
+    else:
+        reason = None
+
+    quality["ok"] = reason is None
+    if reason is not None:
+        quality["reason"] = reason
+    return quality
@@ -0,0 +1,134 @@
+import atexit
+import contextlib
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+
+LOG_LEVEL = os.environ.get("HEART_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("HEART_LOG_FORMAT", "json")     # "json" or "text"
+# Fraction of DEBUG records kept; the per-recording detector lines are DEBUG
+DEBUG_SAMPLE_RATE = float(os.environ.get("HEART_LOG_DEBUG_SAMPLE", "0.1"))
+# Records are dropped (and counted) rather than blocking when the writer falls behind
+LOG_QUEUE_SIZE = 10000
+
+# Third-party loggers that flood DEBUG output (numba logs every compilation step)
+NOISY_LOGGERS = ("numba", "matplotlib", "PIL", "urllib3")
+
+# Correlation ID of the request or job being processed on this task/thread
+request_id = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id", "exc"}
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the timestamp, level, logger, message,
+    request ID and any extra= fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "pid": record.process
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS})
+        exc = getattr(record, "exc", None) or (self.formatException(record.exc_info) if record.exc_info else None)
+        if exc:
+            entry["exc"] = exc
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keep every record at INFO and above, and a random fraction of DEBUG"""
+
+    def __init__(self, rate=DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Non-blocking handler: the calling thread only captures context and
+    enqueues; formatting and I/O happen on the listener thread"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Capture the correlation ID and traceback here, on the caller's context
+        record = copy.copy(record)
+        record.request_id = request_id.get()
+        if record.exc_info:
+            record.exc = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+# Per-process logging state, so forked workers set up their own listener
+_state = {"pid": None, "handler": None, "listener": None}
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None, sample_rate=DEBUG_SAMPLE_RATE):
+    """Route the root logger through a bounded queue to a background writer
+
+    Safe to call more than once; a child process calling it replaces the
+    handler inherited from its parent with one served by its own listener.
+    """
+    if _state["pid"] == os.getpid():
+        return
+    root = logging.getLogger()
+    if _state["handler"] is not None:
+        root.removeHandler(_state["handler"])
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = ContextQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    writer = logging.StreamHandler(stream or sys.stderr)
+    writer.setFormatter(JSONFormatter() if fmt == "json" else logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+    ))
+    listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+    listener.start()
+
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    _state.update(pid=os.getpid(), handler=handler, listener=listener)
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    if _state["listener"] is not None and _state["pid"] == os.getpid():
+        _state["listener"].stop()
+        logging.getLogger().removeHandler(_state["handler"])
+        _state.update(pid=None, handler=None, listener=None)
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+@contextlib.contextmanager
+def correlation(value=None):
+    """Tag every record logged inside the block with a request ID"""
+    token = request_id.set(value or new_request_id())
+    try:
+        yield request_id.get()
+    finally:
+        request_id.reset(token)
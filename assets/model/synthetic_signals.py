@@ -0,0 +1,58 @@
+import numpy as np
+
+def _tone_burst(freq, duration, sr, amplitude):
+    """Exponentially decaying sine burst, a rough model of a valve closure sound"""
+    t = np.arange(int(duration * sr)) / sr
+    return amplitude * np.sin(2 * np.pi * freq * t) * np.exp(-t / (duration / 4))
+
+def _gaussian_wave(t, center, width, amplitude):
+    return amplitude * np.exp(-0.5 * ((t - center) / width)**2)
+
+def synthetic_heart_sound(duration=10.0, sr=4000, heart_rate=72, murmur=False, seed=0):
+    """Generate a deterministic phonocardiogram-like clip
+
+    S1 is a 50 Hz burst at the start of each cycle and S2 a quieter 80 Hz
+    burst 0.3 s later. With murmur=True, band-limited 150-300 Hz noise fills
+    systole. Used for service warm-up, benchmarks and test fixtures.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    y = 0.01 * rng.standard_normal(n)
+    period = 60.0 / heart_rate
+    s1 = _tone_burst(50, 0.1, sr, 1.0)
+    s2 = _tone_burst(80, 0.08, sr, 0.6)
+    systole = 0.3
+
+    for onset in np.arange(0.1, duration - period, period):
+        i1 = int(onset * sr)
+        i2 = int((onset + systole) * sr)
+        y[i1:i1 + len(s1)] += s1
+        y[i2:i2 + len(s2)] += s2
+        if murmur:
+            # Crude band-pass by differencing and smoothing white noise
+            noise = np.diff(rng.standard_normal(i2 - i1 - len(s1) + 1))
+            noise = np.convolve(noise, np.ones(5) / 5, mode="same")
+            y[i1 + len(s1):i2] += 0.3 * noise
+
+    return (0.8 * y / np.max(np.abs(y))).astype(np.float32)
+
+def synthetic_ecg(duration=10.0, sr=250, heart_rate=72, r_lead=0.05, seed=0):
+    """Single-lead ECG synchronized with synthetic_heart_sound
+
+    Each beat is a sum of Gaussian P, QRS and T waves with the R peak r_lead
+    seconds before the matching S1, plus baseline wander and noise. Returns
+    (ecg, r_peak_times).
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    period = 60.0 / heart_rate
+    r_peak_times = np.arange(0.1, duration - period, period) - r_lead
+
+    ecg = 0.1 * np.sin(2 * np.pi * 0.3 * t) + 0.02 * rng.standard_normal(len(t))
+    for r in r_peak_times:
+        ecg += _gaussian_wave(t, r - 0.16, 0.02, 0.15)    # P
+        ecg += _gaussian_wave(t, r - 0.025, 0.008, -0.1)  # Q
+        ecg += _gaussian_wave(t, r, 0.01, 1.0)            # R
+        ecg += _gaussian_wave(t, r + 0.03, 0.008, -0.2)   # S
+        ecg += _gaussian_wave(t, r + 0.25, 0.05, 0.3)     # T
+    return ecg.astype(np.float32), r_peak_times
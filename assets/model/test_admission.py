@@ -0,0 +1,43 @@
+import asyncio
+from admission import FairScheduler
+
+def test_cancelled_waiter_does_not_leak_slot():
+    """A holder releasing in the same tick as a waiter's cancel() keeps the slot usable"""
+    async def scenario():
+        scheduler = FairScheduler(slots=1, weights={})
+        holding = asyncio.Event()
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("a"):
+                holding.set()
+                await release.wait()
+
+        async def waiter():
+            async with scheduler.slot("b"):
+                pass
+
+        holder_task = asyncio.create_task(holder())
+        await holding.wait()
+        waiter_task = asyncio.create_task(waiter())
+        await asyncio.sleep(0)    # Waiter is now queued
+        # Holder wakes first and releases before the cancelled waiter resumes
+        release.set()
+        waiter_task.cancel()
+        await holder_task
+        try:
+            await waiter_task
+        except asyncio.CancelledError:
+            pass
+
+        assert scheduler.free == 1
+        assert scheduler.running == {}
+        assert scheduler.queues == {}
+        # The freed slot is still granted to later requests
+        await asyncio.wait_for(waiter(), timeout=1)
+
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    test_cancelled_waiter_does_not_leak_slot()
+    print("ok")
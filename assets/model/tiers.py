@@ -0,0 +1,52 @@
+import math
+
+# Serving tiers from most to least accurate: (extraction pipeline, model)
+SERVING_TIERS = {
+    "full": ("full", "full"),
+    "reduced": ("full", "compact"),    # Full segmentation, compact model's features only
+    "fast": ("fast", "compact")        # Hilbert envelope, single spectrogram, compact model
+}
+# Without a latency budget, degrade once this many requests wait per slot
+DEGRADE_QUEUE_PER_SLOT = {"reduced": 1, "fast": 2}
+# Weight of each new observation in the per-tier cost averages
+COST_SMOOTHING = 0.1
+
+class TierSelector:
+    """Pick the most accurate tier that fits the expected latency
+
+    Only tiers calibrated at training time (model_metadata.json "tiers")
+    are offered, so every response can quote the accuracy of the tier that
+    produced it. Per-tier extraction costs start from the calibration
+    timings and follow the observed ones.
+    """
+
+    def __init__(self, calibration):
+        self.calibration = calibration
+        self.available = [tier for tier in SERVING_TIERS if tier == "full" or tier in calibration]
+        self.cost_s = {tier: calibration.get(tier, {}).get("extract_ms", math.nan) / 1000
+                       for tier in self.available}
+
+    def observe(self, tier, seconds):
+        cost = self.cost_s[tier]
+        self.cost_s[tier] = seconds if math.isnan(cost) else cost + COST_SMOOTHING * (seconds - cost)
+
+    def choose(self, queued, slots, service_s, budget_ms=None):
+        """Tier for a request arriving with queued requests waiting for slots
+
+        With a budget, the first tier whose expected wait plus extraction
+        time fits it (the cheapest tier if none does). Without one, by
+        queue depth per slot (DEGRADE_QUEUE_PER_SLOT).
+        """
+        if budget_ms is not None:
+            wait_s = queued * service_s / slots
+            for tier in self.available:
+                cost = self.cost_s[tier]
+                if wait_s + (service_s if math.isnan(cost) else cost) <= budget_ms / 1000:
+                    return tier
+            return self.available[-1]
+        depth = queued / slots
+        chosen = "full"
+        for tier in self.available:
+            if depth >= DEGRADE_QUEUE_PER_SLOT.get(tier, 0):
+                chosen = tier
+        return chosen
@@ -1,6 +1,10 @@
 import pandas as pd
 import os
 import glob
+import json
+import argparse
+import shutil
+import tempfile
 import librosa
 import numpy as np
 import librosa.onset
@@ -14,29 +18,53 @@ from sklearn.decomposition import PCA
 from imblearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 from sklearn.feature_selection import SelectFromModel 
-# from sklearn.base import clone
+from sklearn.base import clone
 from imblearn.over_sampling import SMOTE, ADASYN
 import joblib
-from extract_features import extract_features
+import io
+import time
+import logging
+from extract_features import extract_features, aggregate_valve_features, FEATURE_VERSION
+from extract_features import ANALYSIS_SR, MODEL_METADATA_PATH
+from structured_logging import setup_logging
+from drift_monitor import build_reference, REFERENCE_PATH
+from early_exit import validate_early_exit
+from rhythm import rhythm_features_batch, RHYTHM_FEATURES
+from predict_heart_murmur import MODEL_PATH, FEATURE_NAMES_PATH, COMPACT_MODEL_PATH, COMPACT_FEATURE_NAMES_PATH
 # from xgboost import XGBClassifier
 
-# Define standard valve prefixes
-VALVE_PREFIXES = ["AV", "MV", "PV", "TV"]  # Aortic, Mitral, Pulmonary, Tricuspid
+logger = logging.getLogger(__name__)
+
 RANDOM_STATE = 42
 
+# Artifacts used by incremental training
+MANIFEST_PATH = "training_manifest.json"
+FEATURE_STORE_PATH = "training_features.joblib"
+# Bump when the feature store's entry layout changes
+FEATURE_STORE_VERSION = 2
+
+# Compressed serving model: candidate grid and budgets (see compress_model)
+COMPRESSION_TOP_K = (8, 12, 16, 24)
+COMPRESSION_MAX_DEPTH = (4, 6, 8, 12)
+COMPRESSION_N_ESTIMATORS = (25, 50, 100)
+LATENCY_BUDGET_MS = 10.0
+SIZE_BUDGET_KB = 1024.0
+LATENCY_REPEATS = 30
+COMPRESSION_REPORT_PATH = "compression_report.csv"
+
 def parse_recording_locations(location_str):
     """Handle duplicate valves and normalize casing"""
     locations = location_str.split("+") if pd.notna(location_str) else []
     return list(set([v.strip().upper() for v in locations]))
 
-def load_dataset_with_clinical_data(audio_dir, labels_csv):
+def list_labelled_recordings(audio_dir, labels_csv):
+    """List (file_path, patient_id, valve, label) for every recording referenced by the labels CSV"""
     labels = pd.read_csv(labels_csv)
-    features = []
-    valid_labels = []
-    patient_groups = []
+    recordings = []
     
     for idx, row in labels.iterrows():
         patient_id = row["Patient ID"]
+        label = 1 if row["Outcome"] == "Abnormal" else 0
         recording_locations = parse_recording_locations(row["Recording locations:"])
         
         for valve in recording_locations:
@@ -44,21 +72,139 @@ def load_dataset_with_clinical_data(audio_dir, labels_csv):
             valve_files = glob.glob(f"{base_pattern}*.wav") + glob.glob(f"{base_pattern}*.WAV")
             
             for file_path in valve_files:
-                try:
-                    # Directly use centralized feature extraction
-                    feature_dict, _ = extract_features(file_path)
-                    
-                    if "error" not in feature_dict:
-                        features.append(feature_dict)
-                        valid_labels.append(1 if row["Outcome"] == "Abnormal" else 0)
-                        patient_groups.append(patient_id)
-                except Exception as e:
-                    print(f"Error processing {file_path}: {str(e)}")
+                recordings.append((file_path, patient_id, valve, label))
+    
+    return recordings
+
+def extract_recording_features(file_path):
+    """Extract features for one training recording, returning None on failure
+    
+    Returns (feature_dict, peak_times). The rhythm features are missing
+    from feature_dict: add_rhythm_features computes them for the whole
+    training set at once.
+    """
+    try:
+        # Directly use centralized feature extraction
+        peak_times = []
+        feature_dict, _ = extract_features(file_path, peak_times=peak_times)
+        if "error" not in feature_dict:
+            return feature_dict, peak_times[0]
+        logger.warning("Error processing %s: %s", file_path, feature_dict['error'])
+    except Exception:
+        logger.exception("Error processing %s", file_path)
+    return None
+
+def add_rhythm_features(rows):
+    """(feature_dict, peak_times, patient_id, valve, label) rows -> (feature_dict, patient_id, valve, label)
+    with the rhythm features of every recording computed in one vectorized pass"""
+    batch = rhythm_features_batch([row[1] for row in rows])
+    completed = []
+    for i, (feature_dict, _, patient_id, valve, label) in enumerate(rows):
+        rhythm = {name: float(batch[name][i]) for name in RHYTHM_FEATURES if not np.isnan(batch[name][i])}
+        completed.append(({**rhythm, **feature_dict}, patient_id, valve, label))
+    return completed
+
+def build_dataset(rows, patient_level=False):
+    """Assemble X, y and patient groups from (feature_dict, peak_times, patient_id, valve, label) rows
+    
+    With patient_level=True each patient becomes one sample whose features
+    are aggregated per valve (see aggregate_valve_features).
+    """
+    rows = add_rhythm_features(rows)
+    if patient_level:
+        grouped = {}
+        for feature_dict, patient_id, valve, label in rows:
+            valve_features, _ = grouped.setdefault(patient_id, ({}, label))
+            valve_features.setdefault(valve, []).append(feature_dict)
+        features = [aggregate_valve_features(v) for v, _ in grouped.values()]
+        valid_labels = [label for _, label in grouped.values()]
+        patient_groups = list(grouped.keys())
+    else:
+        features = [row[0] for row in rows]
+        patient_groups = [row[1] for row in rows]
+        valid_labels = [row[3] for row in rows]
 
     X = pd.DataFrame(features).fillna(0)
     y = pd.Series(valid_labels)
     return X, y, pd.Series(patient_groups)
 
+def load_dataset_with_clinical_data(audio_dir, labels_csv, patient_level=False):
+    rows = []
+    for file_path, patient_id, valve, label in list_labelled_recordings(audio_dir, labels_csv):
+        extracted = extract_recording_features(file_path)
+        if extracted is not None:
+            rows.append((*extracted, patient_id, valve, label))
+
+    return build_dataset(rows, patient_level)
+
+def file_fingerprint(file_path):
+    """Cheap change detector for an audio file (size and modification time)"""
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def load_dataset_incremental(audio_dir, labels_csv, manifest_path=MANIFEST_PATH, store_path=FEATURE_STORE_PATH,
+                             patient_level=False):
+    """Load the dataset, extracting features only for new or changed recordings
+    
+    The manifest records the fingerprint of every file seen by the previous
+    run and the feature store keeps its extracted features. Labels always come
+    from the current CSV, so relabelled patients need no re-extraction.
+    Recordings that are no longer referenced are dropped from the store.
+    """
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    
+    # Features extracted by an older extractor or at another rate are not comparable
+    if (manifest.get("feature_version") != FEATURE_VERSION or manifest.get("analysis_sr") != ANALYSIS_SR
+            or manifest.get("store_version") != FEATURE_STORE_VERSION):
+        if manifest:
+            print("Feature extractor changed since last run. Re-extracting all recordings.")
+        manifest = {}
+    previous_files = manifest.get("files", {})
+    
+    stored = {}
+    if manifest and os.path.exists(store_path):
+        stored = joblib.load(store_path)
+    
+    recordings = list_labelled_recordings(audio_dir, labels_csv)
+    files = {}
+    store = {}
+    rows = []
+    n_reused = 0
+    n_extracted = 0
+    
+    for file_path, patient_id, valve, label in recordings:
+        fingerprint = file_fingerprint(file_path)
+        previous = previous_files.get(file_path)
+        
+        if previous is not None and previous["fingerprint"] == fingerprint and (
+                file_path in stored or not previous["ok"]):
+            # Unchanged since last run (including files that failed extraction)
+            extracted = stored.get(file_path)
+            n_reused += 1
+        else:
+            extracted = extract_recording_features(file_path)
+            n_extracted += 1
+        
+        files[file_path] = {"fingerprint": fingerprint, "ok": extracted is not None}
+        if extracted is not None:
+            store[file_path] = extracted
+            rows.append((*extracted, patient_id, valve, label))
+    
+    n_removed = len(set(previous_files) - set(files))
+    print(f"Incremental load: {n_extracted} extracted, {n_reused} reused, {n_removed} removed")
+    
+    # Write the store before the manifest so an interrupted save never
+    # leaves a manifest pointing at missing features
+    joblib.dump(store, store_path)
+    with open(manifest_path, "w") as f:
+        json.dump({"feature_version": FEATURE_VERSION, "analysis_sr": ANALYSIS_SR,
+                   "store_version": FEATURE_STORE_VERSION, "files": files}, f, indent=2)
+
+    return build_dataset(rows, patient_level)
+
 def evaluate_with_leave_one_patient_out(X, y, patient_ids):
     """Evaluate model with leave-one-patient-out cross-validation"""
     logo = LeaveOneGroupOut()
@@ -70,8 +216,25 @@ def evaluate_with_leave_one_patient_out(X, y, patient_ids):
         random_state=42
     )
 
-def train_model(X, y, patient_ids, n_splits=5):
-    """Train a model with holdout evaluation"""
+def holdout_split(X, y, patient_ids, test_size=0.2):
+    """Patient-level train/holdout split (deterministic, shared by training and compression)"""
+    unique_patients = np.unique(patient_ids)
+    train_patients, test_patients = train_test_split(
+        unique_patients, test_size=test_size, stratify=None, random_state=RANDOM_STATE
+    )
+    
+    # Create masks for train and test data
+    train_mask = patient_ids.isin(train_patients)
+    test_mask = patient_ids.isin(test_patients)
+    return X.loc[train_mask], X.loc[test_mask], y.loc[train_mask], y.loc[test_mask], train_mask
+
+def train_model(X, y, patient_ids, n_splits=5, cache_dir=None):
+    """Train a model with holdout evaluation
+
+    Scaler and SMOTE outputs are memoized per CV fold in ``cache_dir`` (a
+    temporary directory when not given), so only the classifier is refit
+    for each hyperparameter candidate.
+    """
     print("Total patients:", len(patient_ids))
     print("Class distribution:", y.value_counts())
 
@@ -82,25 +245,21 @@ def train_model(X, y, patient_ids, n_splits=5):
     # Choose appropriate scoring metric
     scoring = 'f1_weighted' if is_multiclass else 'recall'
     
-    # Split into train and test sets while preserving patient groups
-    unique_patients = np.unique(patient_ids)
-    train_patients, test_patients = train_test_split(
-        unique_patients, test_size=0.2, stratify=None, random_state=RANDOM_STATE
-    )
-    
-    # Create masks for train and test data
-    train_mask = patient_ids.isin(train_patients)
-    test_mask = patient_ids.isin(test_patients)
-    
-    # Split data
-    X_train, X_test = X.loc[train_mask], X.loc[test_mask]
-    y_train, y_test = y.loc[train_mask], y.loc[test_mask]
+    X_train, X_test, y_train, y_test, train_mask = holdout_split(X, y, patient_ids)
     
     print(f"Training set size: {X_train.shape[0]} samples")
     print(f"Test set size: {X_test.shape[0]} samples")
     print(f"Training class distribution: {y_train.value_counts()}")
     print(f"Test class distribution: {y_test.value_counts()}")
     
+    # Cache fitted scaler/SMOTE steps. joblib keys each entry on the step
+    # parameters and the fold data, so every candidate that shares a fold
+    # reuses the same scaled and resampled matrix.
+    owns_cache = cache_dir is None
+    if owns_cache:
+        cache_dir = tempfile.mkdtemp(prefix="heart_cv_cache_")
+    memory = joblib.Memory(location=cache_dir, verbose=0)
+
     # Define pipeline
     rf_pipeline = Pipeline([
         ('scaler', StandardScaler()),
@@ -111,7 +270,7 @@ def train_model(X, y, patient_ids, n_splits=5):
             oob_score=True,
             bootstrap=True,
         ))
-    ])
+    ], memory=memory)
     
     # Define parameter grid more like model.py
     param_grid = {
@@ -147,8 +306,14 @@ def train_model(X, y, patient_ids, n_splits=5):
     #     X_train_resampled, y_train_resampled = X_train, y_train
     
     # Find best parameters
-    search.fit(X_train, y_train, groups=patient_ids[train_mask])
+    try:
+        search.fit(X_train, y_train, groups=patient_ids[train_mask])
+    finally:
+        if owns_cache:
+            shutil.rmtree(cache_dir, ignore_errors=True)
     best_model = search.best_estimator_
+    # Detach the cache so the saved model does not reference a deleted directory
+    best_model.set_params(memory=None)
     print(f"Best parameters: {search.best_params_}")
     
     # Evaluate on holdout set
@@ -175,18 +340,220 @@ def train_model(X, y, patient_ids, n_splits=5):
 
     return best_model
 
+def model_size_kb(model):
+    """Serialized size of a model as saved with joblib"""
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell() / 1024
+
+def single_row_latency_ms(model, X, repeats=LATENCY_REPEATS):
+    """Median predict_proba time for one recording, as served"""
+    row = X.iloc[:1]
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_proba(row)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+def holdout_scores(model, X, y):
+    proba = model.predict_proba(X)[:, 1]
+    auc = roc_auc_score(y, proba) if y.nunique() > 1 else float("nan")
+    return auc, recall_score(y, (proba > 0.5).astype(int), pos_label=1)
+
+def compress_model(best_model, X, y, patient_ids, latency_budget_ms=LATENCY_BUDGET_MS,
+                   size_budget_kb=SIZE_BUDGET_KB):
+    """Search a smaller forest that fits a serving latency and size budget
+    
+    Candidates keep the top-k features by the full model's importances,
+    cap the tree depth and trim the tree count; the other hyperparameters
+    come from best_model. Each candidate is fitted on part of the training
+    patients and scored on the rest (validation AUC picks the winner among
+    those within budget), then refitted on all training patients and
+    measured on the holdout: AUC, recall, single-row latency and size.
+    
+    Returns (compact model, its feature names, report DataFrame).
+    """
+    X_train, X_test, y_train, y_test, train_mask = holdout_split(X, y, patient_ids)
+    X_fit, X_val, y_fit, y_val, _ = holdout_split(X_train, y_train, patient_ids[train_mask])
+    
+    ranked = pd.Series(best_model.named_steps['classifier'].feature_importances_,
+                       index=X.columns).sort_values(ascending=False).index
+    
+    def candidate(max_depth, n_estimators):
+        # Single-threaded: for one row, joblib dispatch costs more than the trees
+        return clone(best_model).set_params(
+            classifier__max_depth=max_depth, classifier__n_estimators=n_estimators,
+            classifier__n_jobs=1, classifier__oob_score=False
+        )
+    
+    rows = []
+    for k in [k for k in COMPRESSION_TOP_K if k < len(ranked)] + [len(ranked)]:
+        features = list(ranked[:k])
+        for max_depth in COMPRESSION_MAX_DEPTH:
+            for n_estimators in COMPRESSION_N_ESTIMATORS:
+                val_auc, _ = holdout_scores(candidate(max_depth, n_estimators).fit(X_fit[features], y_fit),
+                                            X_val[features], y_val)
+                model = candidate(max_depth, n_estimators).fit(X_train[features], y_train)
+                auc, recall = holdout_scores(model, X_test[features], y_test)
+                rows.append({
+                    "Features": k, "MaxDepth": max_depth, "Trees": n_estimators,
+                    "Val_AUC": val_auc, "Holdout_AUC": auc, "Holdout_Recall": recall,
+                    "Latency_ms": single_row_latency_ms(model, X_test[features]),
+                    "Size_KB": model_size_kb(model)
+                })
+    report = pd.DataFrame(rows)
+    report["InBudget"] = (report["Latency_ms"] <= latency_budget_ms) & (report["Size_KB"] <= size_budget_kb)
+    
+    pool = report[report["InBudget"]]
+    if pool.empty:
+        logger.warning("No candidate within budget; using the fastest",
+                       extra={"latency_budget_ms": latency_budget_ms, "size_budget_kb": size_budget_kb})
+        chosen = report.sort_values(["Latency_ms", "Size_KB"]).iloc[0]
+    else:
+        # Best validation AUC; ties go to the cheaper model
+        chosen = pool.sort_values(["Val_AUC", "Latency_ms"], ascending=[False, True]).iloc[0]
+    report["Chosen"] = report.index == chosen.name
+    
+    features = list(ranked[:int(chosen["Features"])])
+    compact = candidate(int(chosen["MaxDepth"]), int(chosen["Trees"])).fit(X_train[features], y_train)
+    return compact, features, report
+
+def tier_scores(model, X, y):
+    proba = model.predict_proba(X)[:, 1]
+    return {
+        "accuracy": float(accuracy_score(y, (proba > 0.5).astype(int))),
+        "auc": float(roc_auc_score(y, proba)) if y.nunique() > 1 else None,
+        "recall": float(recall_score(y, (proba > 0.5).astype(int), pos_label=1)),
+        "n": int(len(y))
+    }
+
+def time_extraction(files, **kwargs):
+    """Mean extraction time per recording (ms) with the given extract_features options"""
+    start = time.perf_counter()
+    for file_path in files:
+        extract_features(file_path, **kwargs)
+    return 1000 * (time.perf_counter() - start) / max(len(files), 1)
+
+def calibrate_tiers(best_model, compact_model, compact_features, X, y, patient_ids, recordings,
+                    n_timing_files=20):
+    """Holdout accuracy and extraction time of each serving tier (see tiers.SERVING_TIERS)
+    
+    full and reduced tiers extract identical values, so they are scored on
+    the stored holdout features. The fast tier changes segmentation and
+    spectra, so the holdout recordings are re-extracted with it.
+    """
+    _, X_test, _, y_test, train_mask = holdout_split(X, y, patient_ids)
+    holdout_patients = set(patient_ids[~train_mask])
+    holdout = [(path, label) for path, patient_id, _, label in recordings if patient_id in holdout_patients]
+    timing_files = [path for path, _ in holdout[:n_timing_files]]
+    
+    tiers = {
+        "full": {**tier_scores(best_model, X_test, y_test), "extract_ms": time_extraction(timing_files)},
+        "reduced": {**tier_scores(compact_model, X_test[compact_features], y_test),
+                    "extract_ms": time_extraction(timing_files, feature_names=compact_features)}
+    }
+    
+    fast_rows, fast_labels = [], []
+    start = time.perf_counter()
+    for path, label in holdout:
+        features, _ = extract_features(path, feature_names=compact_features, tier="fast")
+        if "error" not in features:
+            fast_rows.append(features)
+            fast_labels.append(label)
+    fast_ms = 1000 * (time.perf_counter() - start) / max(len(holdout), 1)
+    if fast_rows:
+        X_fast = pd.DataFrame(fast_rows).reindex(columns=compact_features).fillna(0)
+        tiers["fast"] = {**tier_scores(compact_model, X_fast, pd.Series(fast_labels)), "extract_ms": fast_ms}
+    return tiers
+
 # Main execution
 if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Train the heart murmur model")
+    parser.add_argument("--audio-dir", default="heart_sounds/")
+    parser.add_argument("--labels", default="training_data.csv")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only extract features for recordings added or changed since the last run")
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    parser.add_argument("--feature-store", default=FEATURE_STORE_PATH)
+    parser.add_argument("--patient-level", action="store_true",
+                        help="Train on one per-valve aggregated sample per patient")
+    parser.add_argument("--compress", action="store_true",
+                        help="Also save a feature-budgeted, pruned model for low-latency serving")
+    parser.add_argument("--latency-budget-ms", type=float, default=LATENCY_BUDGET_MS,
+                        help="Single-recording predict_proba budget for --compress")
+    parser.add_argument("--size-budget-kb", type=float, default=SIZE_BUDGET_KB,
+                        help="Serialized model size budget for --compress")
+    args = parser.parse_args()
+
     print("Loading dataset...")
-    X, y, patient_ids = load_dataset_with_clinical_data("heart_sounds/", "training_data.csv")
+    if args.incremental:
+        X, y, patient_ids = load_dataset_incremental(
+            args.audio_dir, args.labels, args.manifest, args.feature_store, args.patient_level
+        )
+    else:
+        X, y, patient_ids = load_dataset_with_clinical_data(args.audio_dir, args.labels, args.patient_level)
     
     # Train and evaluate the RandomForest model
     best_model = train_model(X, y, patient_ids)
     
     # Save the model
     print("\nSaving model...")
-    joblib.dump(best_model, 'heart_sound_model.joblib')
-    joblib.dump(X.columns.tolist(), 'feature_names.joblib')
+    joblib.dump(best_model, MODEL_PATH)
+    joblib.dump(X.columns.tolist(), FEATURE_NAMES_PATH)
+    # Training distributions the served features are compared against
+    joblib.dump(build_reference(X), REFERENCE_PATH)
+    
+    # Record how features were computed so inference resamples the same way
+    metadata = {"analysis_sr": ANALYSIS_SR, "feature_version": FEATURE_VERSION}
+    
+    # Early-exit inference must reproduce the full forest's decisions
+    _, X_test, _, y_test, _ = holdout_split(X, y, patient_ids)
+    metadata["early_exit"] = validate_early_exit(best_model, X_test)
+    print(f"\nEarly exit on holdout: {metadata['early_exit']['agreement']:.1%} agreement with full evaluation, "
+          f"{metadata['early_exit']['mean_trees']:.0f}/{metadata['early_exit']['total_trees']} trees on average")
+    
+    if args.compress:
+        print("\nCompressing model...")
+        compact_model, compact_features, report = compress_model(
+            best_model, X, y, patient_ids, args.latency_budget_ms, args.size_budget_kb
+        )
+        report.to_csv(COMPRESSION_REPORT_PATH, index=False)
+        print("\n=== Compression Trade-off (holdout) ===")
+        print(report.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+        
+        chosen = report[report["Chosen"]].iloc[0]
+        full_auc, full_recall = holdout_scores(best_model, X_test, y_test)
+        print(f"\nFull model:    {len(X.columns)} features, {model_size_kb(best_model):.0f} KB, "
+              f"{single_row_latency_ms(best_model, X_test):.2f} ms, "
+              f"holdout AUC {full_auc:.3f}, recall {full_recall:.3f}")
+        print(f"Compact model: {len(compact_features)} features, depth {int(chosen['MaxDepth'])}, "
+              f"{int(chosen['Trees'])} trees, {chosen['Size_KB']:.0f} KB, {chosen['Latency_ms']:.2f} ms, "
+              f"holdout AUC {chosen['Holdout_AUC']:.3f}, recall {chosen['Holdout_Recall']:.3f}")
+        joblib.dump(compact_model, COMPACT_MODEL_PATH)
+        joblib.dump(compact_features, COMPACT_FEATURE_NAMES_PATH)
+        metadata["compact_model"] = {
+            "features": compact_features,
+            **{key: float(chosen[key]) for key in ("MaxDepth", "Trees", "Holdout_AUC", "Holdout_Recall",
+                                                   "Latency_ms", "Size_KB")}
+        }
+        
+        # Degraded serving tiers need per-recording features and the compact model
+        if args.patient_level:
+            print("\nSkipping tier calibration: the service scores single recordings")
+        else:
+            print("\nCalibrating serving tiers...")
+            metadata["tiers"] = calibrate_tiers(
+                best_model, compact_model, compact_features, X, y, patient_ids,
+                list_labelled_recordings(args.audio_dir, args.labels)
+            )
+            for tier, scores in metadata["tiers"].items():
+                print(f"{tier:8} accuracy {scores['accuracy']:.3f}  recall {scores['recall']:.3f}  "
+                      f"extraction {scores['extract_ms']:.0f} ms/recording")
+    
+    with open(MODEL_METADATA_PATH, 'w') as f:
+        json.dump(metadata, f, indent=2)
 
     # Save feature importance
     feature_importance = pd.DataFrame({
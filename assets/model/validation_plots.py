@@ -0,0 +1,153 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import librosa
+import librosa.display
+from dsp_plan import HOP_LENGTH
+from structured_logging import setup_logging
+
+logger = logging.getLogger(__name__)
+
+PLOT_DPI = 300
+# Draft plots: low DPI, decimated waveform and a coarse spectrogram; a few
+# times cheaper to render and write, enough to eyeball peak placement
+DRAFT_PLOT_DPI = 80
+DRAFT_WAVEFORM_POINTS = 4000
+DRAFT_N_FFT = 512
+
+SEGMENT_COLORS = {1: 'green', 2: 'blue', 3: 'purple', 4: 'orange', 0: 'grey'}
+SEGMENT_LABELS = {1: 'S1', 2: 'Systole', 3: 'S2', 4: 'Diastole', 0: 'Unknown'}
+
+def decimate_envelope(audio, sr, n_points):
+    """Min/max per bin, so a long waveform keeps its peaks with n_points samples"""
+    bin_size = max(1, len(audio) // (n_points // 2))
+    if bin_size == 1:
+        return np.arange(len(audio)) / sr, audio
+    n_bins = len(audio) // bin_size
+    bins = audio[:n_bins * bin_size].reshape(n_bins, bin_size)
+    values = np.column_stack((bins.min(axis=1), bins.max(axis=1))).ravel()
+    times = np.repeat(np.arange(n_bins) * bin_size / sr, 2)
+    return times, values
+
+def render_validation_plot(job, draft=False):
+    """Plot detected peaks against the annotated segmentation
+
+    job is the dict extract_features appends to plot_jobs; the onset
+    envelope and per-segment matches are reused from extraction, nothing
+    is recomputed except the spectrogram. Returns the PNG path.
+    """
+    audio, sr = job["audio"], job["sr"]
+    detected_peaks = job["peak_times"]
+    segmentation = job["segmentation"]
+    onset_env = job["onset_env"]
+
+    plt.figure(figsize=(15, 10))
+    gs = plt.GridSpec(3, 1, height_ratios=[2, 1, 1])
+
+    # 1. Main waveform plot with segmentation
+    ax1 = plt.subplot(gs[0])
+    if draft:
+        times, values = decimate_envelope(audio, sr, DRAFT_WAVEFORM_POINTS)
+    else:
+        times, values = np.arange(len(audio)) / sr, audio
+    ax1.plot(times, values, color='grey', alpha=0.7, label='Waveform')
+
+    for i, peak_time in enumerate(detected_peaks):
+        ax1.axvline(x=peak_time, color='red', linestyle='--', alpha=0.7,
+                    label='Detected Peak' if i == 0 else '')
+
+    legend_added = set()
+    for start, end, class_id in zip(segmentation['start_time'].to_numpy(), segmentation['end_time'].to_numpy(),
+                                    segmentation['segment_class'].to_numpy()):
+        label = SEGMENT_LABELS.get(class_id, f'Class {class_id}') if class_id not in legend_added else None
+        ax1.axvspan(start, end, alpha=0.3, color=SEGMENT_COLORS.get(class_id, 'grey'), label=label)
+        legend_added.add(class_id)
+
+    ax1.set_title(f'Heart Sound Analysis: {os.path.basename(job["file_path"])}')
+    ax1.set_ylabel('Amplitude')
+    ax1.legend(loc='upper right')
+    ax1.grid(True, alpha=0.3)
+
+    # 2. Spectrogram plot
+    ax2 = plt.subplot(gs[1], sharex=ax1)
+    n_fft = DRAFT_N_FFT if draft else 2048
+    D = librosa.amplitude_to_db(np.abs(librosa.stft(audio, n_fft=n_fft)), ref=np.max)
+    librosa.display.specshow(D, y_axis='log', x_axis='time', sr=sr, hop_length=n_fft // 4, ax=ax2)
+    ax2.set_ylabel('Frequency (Hz)')
+    ax2.set_title('Spectrogram')
+
+    # 3. Onset envelope from preprocessing, with the picked peaks
+    ax3 = plt.subplot(gs[2], sharex=ax1)
+    times_onset = librosa.times_like(onset_env, sr=sr, hop_length=HOP_LENGTH)
+    ax3.plot(times_onset, onset_env, label='Onset Strength')
+    ax3.set_ylabel('Strength')
+    ax3.set_xlabel('Time (s)')
+    ax3.set_title('Onset Strength')
+
+    frame_peaks = librosa.time_to_frames(detected_peaks, sr=sr, hop_length=HOP_LENGTH)
+    frame_peaks = frame_peaks[frame_peaks < len(onset_env)]
+    ax3.plot(times_onset[frame_peaks], onset_env[frame_peaks], 'ro', markersize=8)
+
+    plt.tight_layout()
+
+    s1_matches, s2_matches = job["s1_matches"], job["s2_matches"]
+    stats_text = "\n".join(
+        f"{name} Detection Rate: {matches.sum()}/{len(matches)} "
+        f"({matches.mean() * 100 if len(matches) else 0:.1f}%)"
+        for name, matches in (("S1", s1_matches), ("S2", s2_matches))
+    ) + f"\nTotal Peaks Detected: {len(detected_peaks)}"
+    plt.figtext(0.02, 0.02, stats_text, fontsize=10, bbox=dict(facecolor='white', alpha=0.8))
+
+    plot_file = os.path.splitext(job["file_path"])[0] + '_validation.png'
+    plt.savefig(plot_file, dpi=DRAFT_PLOT_DPI if draft else PLOT_DPI, bbox_inches='tight')
+    plt.close()
+    logger.info("Validation plot saved to %s", plot_file)
+    return plot_file
+
+def render_validation_plots(jobs, workers=None, draft=False):
+    """Render a batch of plot jobs across processes; returns the PNG paths"""
+    jobs = [job for job in jobs if isinstance(job.get("file_path"), str)]
+    if not jobs:
+        return []
+    if workers == 1 or len(jobs) == 1:
+        return [render_validation_plot(job, draft) for job in jobs]
+    with ProcessPoolExecutor(workers, initializer=setup_logging) as pool:
+        return list(pool.map(render_validation_plot, jobs, [draft] * len(jobs)))
+
+class ValidationPlotter:
+    """Renders plot jobs in a background process as extraction produces them
+
+    Pass it as extract_features(..., plot_jobs=plotter); extraction returns
+    as soon as the job is queued. close() waits for the pending plots.
+    """
+
+    def __init__(self, workers=1, draft=False):
+        self.draft = draft
+        self._pool = ProcessPoolExecutor(workers, initializer=setup_logging)
+        self._pending = []
+
+    def append(self, job):
+        if isinstance(job.get("file_path"), str):
+            self._pending.append(self._pool.submit(render_validation_plot, job, self.draft))
+
+    def close(self):
+        """Wait for queued plots; returns the PNG paths of those that rendered"""
+        paths = []
+        for future in self._pending:
+            try:
+                paths.append(future.result())
+            except Exception:
+                logger.exception("Validation plot failed")
+        self._pool.shutdown()
+        self._pending = []
+        return paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()